@@ -0,0 +1,192 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas
+
+import functions as fns  # Abstracted Functionality
+import engine
+import headers as hd
+import instrumentation as ins
+
+# Batch Mode
+# ==========
+#
+# Each build exports one csv per level / zone. The exports are quantified in parallel
+# worker processes, one per core, since the pandas stages hold the GIL.
+
+SOURCE_HEADER = "Source File"
+
+# Each worker process keeps its own name cache for all the files it is given
+_worker_cache = None
+
+
+def describe_failures(failures):
+    """"1 error" / "N errors" for a batch's failures"""
+    return f"{len(failures)} error{'' if len(failures) == 1 else 's'}"
+
+
+class BatchError(ValueError):
+    """Raised once a batch has run when any of its files failed, the other files' workbooks are still written"""
+
+    def __init__(self, failures, outputs):
+        self.failures = failures
+        self.outputs = outputs
+        details = "; ".join(f"{os.path.basename(fileName)}: {error}" for fileName, error in failures.items())
+        super().__init__(f"finished with {describe_failures(failures)} ({details})")
+
+
+def find_exports(path):
+    """Lists the csv exports in a folder, or matching a glob pattern
+
+    Only a pattern picks up workbooks, e.g. `revisions/*.xlsx` to merge Quantifications workbooks
+    of earlier runs, so a folder of exports can also be the output folder.
+
+    Args:
+        path (str): Folder, or glob pattern such as `exports/*_L1.csv`
+
+    Returns:
+        str[]: Sorted csv paths
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.csv")
+    return sorted(glob.glob(path))
+
+
+def worker_count(jobs):
+    """Number of worker processes for a batch, one per available core
+
+    Args:
+        jobs (int): Number of files in the batch
+
+    Returns:
+        int: Worker processes to start
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on Windows / macOS
+        cores = os.cpu_count() or 1
+    return max(1, min(cores, jobs))
+
+
+def _init_worker():
+    global _worker_cache
+    fns.logging = False  # Workers would interleave their console output
+    _worker_cache = fns.NameCache()
+
+
+def _quantify_file(fileName, outputName, name_map, pivot, units, cache, sheet):
+    if fns.is_workbook(fileName):
+        return engine.quantify_workbook(fileName, outputName, name_map, name_cache=_worker_cache, pivot=pivot, units=units, sheet=sheet)
+    return engine.quantify_csv(fileName, outputName, name_map, name_cache=_worker_cache, pivot=pivot, units=units, cache=cache, sheet=sheet)
+
+
+def _quantify_frame(fileName, name_map, cache):
+    frame = None
+    if cache is not None:
+        key = cache.key(fileName, engine.DEFAULT_NAME_MAP if name_map is None else name_map, engine.PIPELINE_VERSION)
+        frame = cache.get(key)
+        if frame is not None:
+            # Parquet doesn't keep every declared type, e.g. numeric categories
+            frame = engine.apply_schema(frame)
+    if frame is None:
+        if fns.is_workbook(fileName):
+            frame = engine.read_quantifications(fileName, name_map, _worker_cache)
+        else:
+            index = hd.HeaderIndex.from_csv(fileName)
+            frame = engine.run_pipeline(engine.read_export(fileName, index), name_map, name_cache=_worker_cache, index=index.project())
+        if cache is not None:
+            cache.put(key, frame)
+
+    # A merged workbook keeps the files its rows came from
+    if SOURCE_HEADER not in frame.columns:
+        frame.insert(0, SOURCE_HEADER, os.path.basename(fileName))
+    return frame
+
+
+def quantify_batch(inputs, outputDir, name_map=None, progress=None, merge=False, workers=None, pivot="static", units="values", cache=None, sheet="table"):
+    """Quantifies a batch of Navisworks csv exports across a process pool
+
+    Quantifications workbooks of earlier runs can be in the batch too, see `engine.read_quantifications`.
+
+    Args:
+        inputs (str | str[]): Folder, glob pattern or list of csv / xlsx files
+        outputDir (str): Folder the workbooks are written to
+        name_map (dict, optional): Part code replacements. Defaults to `engine.DEFAULT_NAME_MAP`.
+        progress (callable, optional): Called with a number between 0 - 1 as each file finishes. Defaults to None.
+        merge (bool, optional): Write one merged workbook instead of one per input. Defaults to False.
+        workers (int, optional): Worker processes, defaults to one per available core. Defaults to None.
+        pivot (str, optional): Pivot Table sheet, one of `engine.PIVOT_MODES`. Defaults to "static".
+        units (str, optional): Units column, one of `engine.UNITS_MODES`. Defaults to "values".
+        cache (`cache.ResultCache`, optional): Reuses the quantified tables of unchanged exports. Defaults to None.
+        sheet (str, optional): Quantifications sheet, one of `engine.SHEET_MODES`. Defaults to "table".
+
+    Raises:
+        BatchError: If any file failed, after the other files are written
+
+    Returns:
+        str[]: Paths of the written xlsx files
+    """
+    report = progress or (lambda amount: None)
+    files = find_exports(inputs) if isinstance(inputs, str) else list(inputs)
+    if not files:
+        raise ValueError(f"No csv files found in {inputs}")
+
+    os.makedirs(outputDir, exist_ok=True)
+    workers = workers or worker_count(len(files))
+    fns.log(f"Quantifying {len(files)} files with {workers} workers")
+
+    outputs = []
+    frames = {}
+    failures = {}
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    try:
+        # The workers' stages run in other processes, the run only sees the pool as a whole
+        with ins.stage("workers"):
+            if merge:
+                futures = {executor.submit(_quantify_frame, fileName, name_map, cache): fileName for fileName in files}
+            else:
+                futures = {}
+                for fileName in files:
+                    outputName = os.path.join(outputDir, os.path.splitext(os.path.basename(fileName))[0] + " Quantifications")
+                    futures[executor.submit(_quantify_file, fileName, outputName, name_map, pivot, units, cache, sheet)] = fileName
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                fileName = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    fns.log(f"{os.path.basename(fileName)}: {e}", 'error')
+                    failures[fileName] = e
+                else:
+                    if merge:
+                        frames[fileName] = result
+                    else:
+                        outputs.append(result)
+                    fns.log(f"Finished {os.path.basename(fileName)} ({done}/{len(files)})", 'message')
+
+                # Leave room for writing the merged workbook
+                report(done / len(files) * (0.9 if merge else 1.0))
+    except BaseException:
+        # Don't wait for queued files when cancelled or failing
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    if merge and frames:
+        # Keep the input order, not the finishing order
+        merged = pandas.concat([frames[fileName] for fileName in files if fileName in frames], ignore_index=True)
+        # Files with different categories concatenate to plain text columns
+        merged = engine.apply_schema(merged)
+        merged[SOURCE_HEADER] = merged[SOURCE_HEADER].astype("category")
+        outputPath = os.path.join(outputDir, "Merged Quantifications.xlsx")
+        # Last chance to cancel, the write itself reports no progress
+        report(None)
+        engine.write_workbook(merged, outputPath, pivot, units, sheet=sheet)
+        outputs.append(outputPath)
+        report(1.0)
+
+    if failures:
+        # Keep the input order
+        raise BatchError({fileName: failures[fileName] for fileName in files if fileName in failures}, sorted(outputs))
+    return sorted(outputs)
@@ -0,0 +1,495 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy
+import pandas
+
+import functions as fns  # Abstracted Functionality
+import engine
+import headers as hd
+import instrumentation as ins
+
+# Benchmarks
+# ==========
+#
+# Run with `python benchmark.py` to time every pipeline stage at 10k / 100k / 1M rows on
+# synthetic exports. Each run is appended to a JSON history and compared with the previous
+# one, so a change that slows a stage down shows up. `python benchmark.py --micro` runs the
+# older comparisons: vectorized stages against the per-cell approach the Office Scripts use,
+# and the memory taken by the declared column types.
+
+HISTORY_FILE = "benchmark_history.json"
+PIPELINE_SIZES = (10000, 100000, 1000000)
+
+# Stages slower than the previous run by more than this fraction are reported,
+# unless the difference is too small to tell from noise
+REGRESSION_THRESHOLD = 0.1
+REGRESSION_MIN_SECONDS = 0.05
+
+# Part names and how common they are, a few parts make up most of an export
+PARTS = {
+    "P1428-H-41 Channel": 30, "P1428-H-21 Channel": 12, "M12 Threaded Rod": 20, "M12 Nut": 10, "M16 Threaded Rod": 3,
+    "P1062 Clamp": 10, "P1062 Bracket": 4, "Casework": 5, "MIDAS_Plate_2": 4, "Unistrut Cantilever Arm": 2,
+}
+
+
+def synthetic_names(rows, seed=0):
+    """Builds a Name column with control characters and trailing numbers like a Navisworks export
+
+    Args:
+        rows (int): Number of rows
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        `pandas.Series`: Name column
+    """
+    rng = numpy.random.default_rng(seed)
+    parts = numpy.array(list(PARTS), dtype=object)
+    weights = numpy.array(list(PARTS.values()), dtype="float64")
+    names = parts[rng.choice(len(parts), rows, p=weights / weights.sum())]
+    names = names + numpy.where(rng.random(rows) < 0.3, "\r\n", "") + " " + rng.integers(1, 500, rows).astype(str)
+    return pandas.Series(names, dtype=object)
+
+
+def synthetic_export(rows, seed=0, length_variants=2, angle_variants=1):
+    """Builds a raw Navisworks export with the legend columns and a few length / angle variants
+
+    Args:
+        rows (int): Number of rows
+        seed (int, optional): Random seed. Defaults to 0.
+        length_variants (int, optional): Length columns merged into Unistrut Length, at least 2. Defaults to 2.
+        angle_variants (int, optional): Angle columns merged into Angle, at least 1. Defaults to 1.
+
+    Returns:
+        `pandas.DataFrame`: Raw export, headers still prefixed
+    """
+    rng = numpy.random.default_rng(seed)
+    export = pandas.DataFrame({
+        "Element ID": numpy.arange(rows),
+        "Item GUID": [f"{value:032x}" for value in rng.integers(0, 2**62, rows)],
+        "Element Category": rng.choice(["Generic Models", "Pipe Accessories", "Structural Framing"], rows),
+        "Custom KGE_Location": rng.choice(["Level 1", "Level 2", "Roof"], rows),
+        "Element Name": synthetic_names(rows, seed),
+        "Element Size": rng.choice(["41x41", "41x21", "M10", ""], rows),
+        "Element Rod Length": rng.choice(["", "300 mm", "600 mm"], rows),
+        "Element Length": rng.choice(["", "1200 mm", "0.5 mm"], rows),
+        "Element Unistrut Length": rng.choice(["", "600 mm", "3000 mm"], rows),
+        "Element Angle": rng.choice(["", "90"], rows),
+        "Element length": rng.choice(["", "800 mm"], rows),
+        "Element Angle 2": rng.choice(["", "45"], rows),
+        "Element Service type": rng.choice(["HVAC", "Plumbing", "Electrical"], rows),
+        "Custom Raceway Name": rng.choice(["", "Tray A", "Tray B"], rows),
+        "Custom Raceway Ref. Number": rng.integers(1, 50, rows),
+    })
+
+    # Further variants go after the legend columns, like properties from other categories
+    for number in range(3, length_variants + 1):
+        export[f"Item Length {number}"] = rng.choice(["", "450 mm", "2400 mm"], rows)
+    for number in range(3, angle_variants + 2):
+        export[f"Item Angle {number}"] = rng.choice(["", "30"], rows)
+    return export
+
+
+# Length rows the Office Script and `engine.merge_lengths` must agree on:
+# (Length, Unistrut Length, length), in both column orders of the first two
+LENGTH_CASES = [
+    ("1200 mm", "600 mm", ""),  # a length above 1 wins over the Unistrut Length, wherever it is
+    ("", "600 mm", ""),
+    ("0.5 mm", "", ""),
+    ("1 mm", "600 mm", ""),
+    ("1200 mm", "3000 mm", "800 mm"),
+    ("", "", ""),
+]
+
+
+def script_lengths(frame, unistrut, lengths):
+    """Unistrut Length worked out the way the 0.9.5 Office Script does, one column at a time
+
+    The script writes every length above 1 into the Unistrut cell as it goes, the Unistrut Length
+    column included, which by its turn holds whatever an earlier column wrote. Blanks become 1.
+
+    Args:
+        frame (`pandas.DataFrame`): Export with cleaned headers
+        unistrut (str): Unistrut Length header
+        lengths (str[]): Length variant headers, `headers.HeaderIndex.lengths`
+
+    Returns:
+        `pandas.Series`: Unistrut Length column
+    """
+    merged = set(lengths) | {unistrut}
+    cell = fns.to_numbers(frame[unistrut], " mm")
+    for header in frame.columns:
+        if header in merged:
+            values = cell if header == unistrut else fns.to_numbers(frame[header], " mm")
+            cell = numpy.where(values > 1, values, cell)
+    return pandas.Series(cell, index=frame.index).fillna(1)
+
+
+def check_length_parity(rows=10000):
+    """Compares `engine.merge_lengths` with `script_lengths` on `LENGTH_CASES` and a synthetic export
+
+    Args:
+        rows (int, optional): Rows of the synthetic export. Defaults to 10000.
+
+    Returns:
+        int: Rows where the two differ
+    """
+    cases = pandas.DataFrame(LENGTH_CASES, columns=["Element Length", "Element Unistrut Length", "Element length"])
+    exports = [synthetic_export(rows), cases, cases[["Element Unistrut Length", "Element Length", "Element length"]]]
+
+    mismatches = 0
+    for export in exports:
+        index = hd.HeaderIndex(export.columns)
+        frame = export.set_axis(index.headers, axis=1)
+        unistrut = index.required["unistrut"]
+        expected = script_lengths(frame, unistrut, index.lengths)
+        engine.merge_lengths(frame, unistrut, index.lengths)
+        mismatches += int((frame[unistrut].to_numpy() != expected.to_numpy()).sum())
+
+    fns.log(f"Lengths, {rows + 2 * len(cases)} rows: {mismatches} differ from the Office Script", 'message' if not mismatches else 'error')
+    return mismatches
+
+
+def timed(function, *args):
+    """Returns the seconds taken by `function(*args)`"""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def bench_control_characters(rows=100000):
+    """Per-cell regex cleanup vs the vectorized `removeControlCharacters`
+
+    Args:
+        rows (int, optional): Number of rows. Defaults to 100000.
+
+    Returns:
+        dict: Seconds taken by each approach
+    """
+    names = synthetic_names(rows)
+    controlCharsRegex = re.compile("[\u0000-\u001F\u007F-\u009F]")
+
+    results = {
+        "per_cell": timed(lambda: names.map(lambda name: controlCharsRegex.sub("", name))),
+        "vectorized": timed(fns.removeControlCharacters, names),
+    }
+    fns.log(f"Control characters, {rows} rows: per cell {results['per_cell']:.3f}s, vectorized {results['vectorized']:.3f}s", 'message')
+    return results
+
+
+def _read_all_rows(workbook):
+    """Reads every cell of the Quantifications sheet, then closes the workbook"""
+    for row in workbook[engine.SHEET_NAME].iter_rows(values_only=True):
+        pass
+    workbook.close()
+
+
+def bench_units(rows=100000):
+    """Units column as plain values, relative formulas and the Office Script's INDIRECT formulas
+
+    Only the write time, the file size and the time openpyxl takes to read every cell are measured.
+    Recalculation is not: Excel can't be driven from here and openpyxl never evaluates formulas.
+
+    Args:
+        rows (int, optional): Number of rows. Defaults to 100000.
+
+    Returns:
+        dict: write seconds, read seconds and file size for each choice
+    """
+    import openpyxl
+
+    quantified = engine.run_pipeline(synthetic_export(rows))
+    indirect = quantified.copy()
+    indirect[engine.UNITS_HEADER] = '=IF(INDIRECT(ADDRESS(ROW(),COLUMN()-1))>1,"mm","No.")'
+
+    choices = {
+        "values": quantified,
+        "formula": engine.units_as_formulas(quantified),
+        "indirect": indirect,
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for choice, frame in choices.items():
+            path = os.path.join(directory, f"{choice}.xlsx")
+            write = timed(lambda: frame.to_excel(path, sheet_name=engine.SHEET_NAME, index=False, engine="xlsxwriter"))
+            read = timed(lambda: _read_all_rows(openpyxl.load_workbook(path, read_only=True)))
+            results[choice] = {"write": write, "read": read, "bytes": os.path.getsize(path)}
+            fns.log(f"Units as {choice}, {rows} rows: write {write:.2f}s, openpyxl read {read:.2f}s, "
+                    f"{results[choice]['bytes'] / 1e6:.1f} MB, recalculation not measured", 'message')
+    return results
+
+
+def _bytes_per_row(frame):
+    return frame.memory_usage(deep=True, index=False).sum() / max(len(frame), 1)
+
+
+def _default_types(frame):
+    """The table with the types pandas would have used without the declared schema"""
+    frame = frame.copy()
+    for header in frame.columns:
+        if frame[header].dtype == "float32":
+            frame[header] = frame[header].astype("float64")
+        elif not pandas.api.types.is_numeric_dtype(frame[header]):
+            frame[header] = frame[header].astype(object)
+    return frame
+
+
+def bench_memory(rows=100000):
+    """Memory per row of the raw export and the Quantifications table, pandas' default types vs the declared schema
+
+    Args:
+        rows (int, optional): Number of rows. Defaults to 100000.
+
+    Returns:
+        dict: bytes per row of each table with default and declared types
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.csv")
+        synthetic_export(rows).to_csv(path, index=False)
+
+        raw = pandas.read_csv(path)
+        typed = engine.read_export(path)
+        quantified = engine.run_pipeline(typed.copy())
+
+    results = {
+        "export": {"default": _bytes_per_row(raw), "declared": _bytes_per_row(typed)},
+        "quantified": {"default": _bytes_per_row(_default_types(quantified)), "declared": _bytes_per_row(quantified)},
+    }
+    for table, sizes in results.items():
+        fns.log(f"{table.capitalize()} table, {rows} rows: {sizes['default']:.0f} bytes per row with default types, "
+                f"{sizes['declared']:.0f} with the declared schema ({sizes['default'] / sizes['declared']:.1f}x smaller)", 'message')
+    return results
+
+
+def bench_projection(rows=100000, properties=300):
+    """Reading every column of an "export all properties" csv vs only the pricing pack columns
+
+    Args:
+        rows (int, optional): Number of rows. Defaults to 100000.
+        properties (int, optional): Extra Navisworks properties in the export. Defaults to 300.
+
+    Returns:
+        dict: seconds and bytes in memory for each reader
+    """
+    export = synthetic_export(rows)
+    rng = numpy.random.default_rng(1)
+    extra = pandas.DataFrame({f"Item Property {number}": rng.choice(["Yes", "No", "Unknown"], rows) for number in range(properties)})
+    export = pandas.concat([export, extra], axis=1)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.csv")
+        export.to_csv(path, index=False)
+
+        for reader, read in (("all_columns", pandas.read_csv), ("projected", engine.read_export)):
+            start = time.perf_counter()
+            frame = read(path)
+            results[reader] = {"seconds": time.perf_counter() - start, "bytes": int(frame.memory_usage(deep=True).sum())}
+            fns.log(f"Reading {rows} rows x {export.shape[1]} columns, {reader}: {results[reader]['seconds']:.2f}s, "
+                    f"{frame.shape[1]} columns, {results[reader]['bytes'] / 1e6:.1f} MB", 'message')
+    return results
+
+
+def bench_pipeline(rows=100000, seed=0, length_variants=2, angle_variants=1):
+    """Times every stage of a quantification on a synthetic export
+
+    Run it in a fresh process (see `run_suite`) for the peak memory to belong to this size alone.
+
+    Args:
+        rows (int, optional): Number of rows. Defaults to 100000.
+        seed (int, optional): Random seed. Defaults to 0.
+        length_variants (int, optional): Length columns merged into Unistrut Length. Defaults to 2.
+        angle_variants (int, optional): Angle columns merged into Angle. Defaults to 1.
+
+    Returns:
+        dict: `rows`, seconds per stage, `total` seconds, `rows_per_second` and `peak_bytes`
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.csv")
+        synthetic_export(rows, seed, length_variants, angle_variants).to_csv(path, index=False)
+
+        # The pipeline times its own stages when a run is being recorded
+        with ins.Run("benchmark") as record:
+            engine.quantify_csv(path, os.path.join(directory, "export"))
+
+    stages = {name: stage["seconds"] for name, stage in record.stages.items()}
+    total = sum(stages.values())
+    return {"rows": rows, "stages": stages, "total": total, "rows_per_second": rows / total if total else 0.0, "peak_bytes": ins.peak_rss()}
+
+
+def bench_cold_start(repeats=5):
+    """Times fresh command line processes, the start up cost of build scripts and scheduled jobs
+
+    Args:
+        repeats (int, optional): Runs of each command, the fastest is kept. Defaults to 5.
+
+    Returns:
+        dict: Seconds of `--version` (interpreter and argument parsing) and `check` (reading a header row)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.csv")
+        synthetic_export(10).to_csv(path, index=False)
+
+        commands = {"version": ["--version"], "check": ["check", path, "-q"]}
+        results = {}
+        for name, arguments in commands.items():
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, "-m", "quantifications", *arguments], cwd=here, check=True, capture_output=True)
+                timings.append(time.perf_counter() - start)
+            results[name] = min(timings)
+
+    fns.log(f"Cold start: {', '.join(f'{name} {seconds:.3f}s' for name, seconds in results.items())}", 'message')
+    return results
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_suite(sizes=PIPELINE_SIZES, length_variants=2, angle_variants=1):
+    """Runs `bench_pipeline` for each size, each in its own process
+
+    Args:
+        sizes (int[], optional): Row counts. Defaults to 10k, 100k and 1M.
+        length_variants (int, optional): Length columns merged into Unistrut Length. Defaults to 2.
+        angle_variants (int, optional): Angle columns merged into Angle. Defaults to 1.
+
+    Returns:
+        dict: Run record with the environment and one result per size
+    """
+    results = []
+    for rows in sizes:
+        # A fresh process per size, so the peak memory isn't carried over from a bigger size
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(bench_pipeline, rows, 0, length_variants, angle_variants).result()
+        results.append(result)
+
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result["stages"].items())
+        peak = f"{result['peak_bytes'] / 1e6:.0f} MB" if result["peak_bytes"] else "unknown"
+        fns.log(f"{rows} rows: {stages}; total {result['total']:.2f}s ({result['rows_per_second']:,.0f} rows/s), peak memory {peak}", 'message')
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "machine": platform.machine(),
+        "variants": {"length": length_variants, "angle": angle_variants},
+        "results": results,
+        "cold_start": bench_cold_start(),
+    }
+
+
+def load_history(path=HISTORY_FILE):
+    """Reads the benchmark history, an empty list if there isn't one yet"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_run(run, path=HISTORY_FILE):
+    """Appends a run record to the benchmark history
+
+    Args:
+        run (dict): Result of `run_suite`
+        path (str, optional): History file. Defaults to `HISTORY_FILE`.
+    """
+    history = load_history(path)
+    history.append(run)
+
+    # Written under a temporary name so a crash can't lose the history
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(history, file, indent=2)
+    os.replace(temporary, path)
+
+
+def compare_runs(previous, current, threshold=REGRESSION_THRESHOLD):
+    """Lists the stages that got slower between two runs, for the sizes both ran
+
+    Args:
+        previous (dict): Earlier run record
+        current (dict): Later run record
+        threshold (float, optional): Slowdown fraction to report. Defaults to `REGRESSION_THRESHOLD`.
+
+    Returns:
+        tuple[]: (rows, stage, previous seconds, current seconds), rows is `None` for the cold start
+    """
+    before = {result["rows"]: result for result in previous["results"]}
+    regressions = []
+    for result in current["results"]:
+        earlier = before.get(result["rows"])
+        if earlier is None:
+            continue
+        earlierTimings = {**earlier["stages"], "total": earlier["total"]}
+        for stage, seconds in {**result["stages"], "total": result["total"]}.items():
+            old = earlierTimings.get(stage)
+            if old and seconds > old * (1 + threshold) and seconds - old > REGRESSION_MIN_SECONDS:
+                regressions.append((result["rows"], stage, old, seconds))
+
+    earlierStart = previous.get("cold_start", {})
+    for command, seconds in current.get("cold_start", {}).items():
+        old = earlierStart.get(command)
+        if old and seconds > old * (1 + threshold) and seconds - old > REGRESSION_MIN_SECONDS:
+            regressions.append((None, f"cold start {command}", old, seconds))
+    return regressions
+
+
+def run_micro():
+    """Runs the single stage comparisons"""
+    check_length_parity()
+    bench_projection()
+    for rows in (10000, 100000, 1000000):
+        bench_memory(rows)
+
+    for rows in (10000, 100000, 1000000):
+        bench_control_characters(rows)
+
+    for rows in (10000, 100000):
+        bench_units(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantification pipeline benchmarks")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(PIPELINE_SIZES), help="Rows of each synthetic export")
+    parser.add_argument("--lengths", type=int, default=2, help="Length variant columns")
+    parser.add_argument("--angles", type=int, default=1, help="Angle variant columns")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON file the runs are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Don't add this run to the history")
+    parser.add_argument("--micro", action="store_true", help="Run the single stage comparisons instead")
+    args = parser.parse_args()
+
+    if args.micro:
+        run_micro()
+        sys.exit()
+
+    run = run_suite(args.rows, args.lengths, args.angles)
+    history = load_history(args.history)
+    if history:
+        regressions = compare_runs(history[-1], run)
+        for rows, stage, old, new in regressions:
+            fns.log(f"{f'{rows} rows, ' if rows is not None else ''}{stage}: {old:.2f}s -> {new:.2f}s ({new / old - 1:+.0%})", 'warning')
+        if not regressions:
+            fns.log(f"No stage slower than the previous run ({history[-1]['timestamp']})", 'message')
+    if not args.no_save:
+        save_run(run, args.history)
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+
+import functions as fns  # Abstracted Functionality
+
+# Result Cache
+# ============
+#
+# Quantified tables are cached on disk keyed by a hash of the input file, the name table
+# and the pipeline version, so re-running the tool on an unchanged export (e.g. after
+# changing only the pivot / units options) skips parsing and the pipeline entirely.
+# Least recently used entries are evicted once the cache grows past `max_bytes`.
+
+# Bump whenever the columns or types of the cached tables change, so older entries are missed
+# 2: only the selected columns, with the declared column types
+CACHE_VERSION = 2
+
+
+def default_path():
+    """Path of the result cache in the user's cache folder"""
+    import platformdirs
+    return os.path.join(platformdirs.user_cache_dir("Quantifications-App", "Kirby Group Engineering"), "results")
+
+
+def hash_file(fileName, blockSize=1 << 20):
+    """Hashes a file's contents without reading it into memory at once
+
+    Args:
+        fileName (str): File to hash
+        blockSize (int, optional): Bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(fileName, "rb") as file:
+        while block := file.read(blockSize):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_frame(frame, basePath):
+    """Saves a table as Parquet, or as a pickle when Arrow can't represent a mixed type column
+
+    Args:
+        frame (`pandas.DataFrame`): Table to save
+        basePath (str): Path without extension
+
+    Returns:
+        str: Path of the written file
+    """
+    path = basePath + ".parquet"
+    temporary = basePath + ".tmp"
+    try:
+        frame.to_parquet(temporary, index=False)
+    except ImportError:
+        raise
+    except Exception:
+        path = basePath + ".pkl"
+        frame.to_pickle(temporary)
+
+    # Written under a temporary name so a crash can't leave half a file
+    os.replace(temporary, path)
+    return path
+
+
+def read_frame(path):
+    """Reads a table saved by `write_frame`"""
+    import pandas
+    return pandas.read_parquet(path) if path.endswith(".parquet") else pandas.read_pickle(path)
+
+
+class ResultCache:
+    """Size bounded on-disk cache of quantified `pandas.DataFrame`s"""
+
+    def __init__(self, path=None, max_bytes=1 << 30):
+        self.path = path or default_path()
+        self.max_bytes = max_bytes
+
+    def key(self, fileName, name_map, version):
+        """Cache key for an input file, name table and pipeline version
+
+        Args:
+            fileName (str): Input csv
+            name_map (dict): Name conversions used for the run
+            version (str): Pipeline version, changing it invalidates every entry
+
+        Returns:
+            str: Hex digest
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(hash_file(fileName).encode("ascii"))
+        digest.update(json.dumps(sorted((str(k), str(v)) for k, v in name_map.items())).encode("utf-8"))
+        digest.update(f"{version}/{CACHE_VERSION}".encode("ascii"))
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        for extension in (".parquet", ".pkl"):
+            path = os.path.join(self.path, key + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def get(self, key):
+        """Reads a cached table
+
+        Args:
+            key (str): Result of `key`
+
+        Returns:
+            `pandas.DataFrame`: Cached table, or `None` on a miss
+        """
+        path = self._entry(key)
+        if path is None:
+            return None
+        try:
+            frame = read_frame(path)
+        except Exception as e:
+            fns.log(f"Dropping unreadable cache entry {path}: {e}", 'warning')
+            self._remove(path)
+            return None
+
+        # Mark as recently used
+        os.utime(path)
+        return frame
+
+    def put(self, key, frame):
+        """Caches a table, then evicts old entries if the cache is too big
+
+        Parquet is used where Arrow can represent every column, mixed type text columns
+        fall back to pickle.
+
+        Args:
+            key (str): Result of `key`
+            frame (`pandas.DataFrame`): Table to cache
+        """
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            write_frame(frame, os.path.join(self.path, key))
+        except ImportError:
+            fns.log("pyarrow is not installed, results can't be cached", 'warning')
+            return
+        self.evict()
+
+    def entries(self):
+        """Lists the cached entries, most recently used first
+
+        Returns:
+            tuple[]: (path, bytes, last used timestamp)
+        """
+        if not os.path.isdir(self.path):
+            return []
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # Evicted by another process
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2], reverse=True)
+
+    def size(self):
+        """Total bytes used by the cache"""
+        return sum(size for path, size, used in self.entries())
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in `max_bytes`"""
+        total = 0
+        for path, size, used in self.entries():
+            total += size
+            if total > self.max_bytes:
+                self._remove(path)
+
+    def clear(self):
+        """Removes every cached entry"""
+        for path, size, used in self.entries():
+            self._remove(path)
+        fns.log("Cleared the result cache", 'message')
+
+    def describe(self):
+        """Short summary for the Settings tab, e.g. `3 results, 42.0 MB`"""
+        entries = self.entries()
+        total = sum(size for path, size, used in entries)
+        return f"{len(entries)} results, {total / 1e6:.1f} MB"
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
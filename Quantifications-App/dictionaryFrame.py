@@ -30,6 +30,7 @@ class DictionaryFrame(CTkBaseClass):
                  overwrite_preferred_drawing_method: Union[str, None] = None,
                  num_rows: int = 10,
                  num_cols: int = 2,
+                 visible_rows: int = 10,
                  **kwargs):
 
         # transfer basic functionality (_bg_color, size, __appearance_mode, scaling) to CTkBaseClass
@@ -41,6 +42,13 @@ class DictionaryFrame(CTkBaseClass):
         fns.log(f"{self.num_rows} Rows and {self.num_cols} Columns", 'message')
         self.text_boxes = []
 
+        # The table lives in self.rows, only `visible_rows` rows of entries exist and they
+        # are refilled from self.rows as the table scrolls, so big tables build instantly
+        self.rows = [[""] * num_cols for _ in range(num_rows)]
+        self.visible_rows = visible_rows
+        self.first_row = 0
+        self._refresh_id = None
+
 
         # color
         self._border_color = ThemeManager.theme["CTkFrame"]["border_color"] if border_color is None else self._check_color_type(border_color)
@@ -104,7 +112,13 @@ class DictionaryFrame(CTkBaseClass):
 
 
     def set_num_rows(self, num):
+        self._store_view()
         self.num_rows = num
+        if num > len(self.rows):
+            self.rows.extend([""] * self.num_cols for _ in range(num - len(self.rows)))
+        else:
+            del self.rows[num:]
+        self.schedule_refresh()
         
     def set_num_cols(self, num):
         self.num_cols = num
@@ -117,31 +131,154 @@ class DictionaryFrame(CTkBaseClass):
         for col in range(self.num_cols):
             label = ctk.CTkLabel(self, text=col_names[col] if col < len(col_names) else f"Column {col+1}")
             label.grid(row=0, column=col, padx=5, pady=5)
-            
-        for row in range(self.num_rows):
-            row_boxes = []
-            for col in range(self.num_cols):
-                text_box = ctk.CTkEntry(self, width=self._current_width // self.num_cols, height=30)
-                text_box.grid(row=row+1, column=col, padx=5, pady=5)
-                row_boxes.append(text_box)
-            self.text_boxes.append(row_boxes)
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.bind("<MouseWheel>", self._on_mouse_wheel)
+        self.bind("<Button-4>", self._on_mouse_wheel)
+        self.bind("<Button-5>", self._on_mouse_wheel)
+
+        self._refresh_view()
         # self._canvas.tag_lower("inner_parts")  # maybe unnecessary, I don't know ???
         # self._canvas.tag_lower("border_parts")
 
+    def _create_row_boxes(self, view_row):
+        row_boxes = []
+        for col in range(self.num_cols):
+            text_box = ctk.CTkEntry(self, width=self._current_width // self.num_cols, height=30)
+            text_box.grid(row=view_row+1, column=col, padx=5, pady=5)
+            text_box.bind("<KeyRelease>", lambda event, r=view_row, c=col: self._store_cell(r, c))
+            text_box.bind("<FocusOut>", lambda event, r=view_row, c=col: self._store_cell(r, c))
+            text_box.bind("<<Paste>>", lambda event, r=view_row, c=col: self._on_paste(r, c))
+            text_box.bind("<MouseWheel>", self._on_mouse_wheel)
+            text_box.bind("<Button-4>", self._on_mouse_wheel)
+            text_box.bind("<Button-5>", self._on_mouse_wheel)
+            row_boxes.append(text_box)
+        return row_boxes
+
+    def schedule_refresh(self):
+        """Refreshes the entries once Tk is idle, so many changes in a row cause a single layout pass"""
+        if self._refresh_id is None:
+            self._refresh_id = self.after_idle(self._refresh_view)
+
+    def _refresh_view(self):
+        """Makes the entries show self.rows from self.first_row down"""
+        self._refresh_id = None
+        if not hasattr(self, "scrollbar"):
+            return
+
+        # Only as many rows of entries as fit in the view (or as there are rows),
+        # rows are gridded / destroyed one at a time as the table grows and shrinks
+        view_rows = min(len(self.rows), self.visible_rows)
+        while len(self.text_boxes) < view_rows:
+            self.text_boxes.append(self._create_row_boxes(len(self.text_boxes)))
+        while len(self.text_boxes) > view_rows:
+            for text_box in self.text_boxes.pop():
+                text_box.destroy()
+
+        self.first_row = max(0, min(self.first_row, len(self.rows) - view_rows))
+        for view_row, row_boxes in enumerate(self.text_boxes):
+            values = self.rows[self.first_row + view_row]
+            for col, text_box in enumerate(row_boxes):
+                if text_box.get() != values[col]:
+                    text_box.delete(0, "end")
+                    text_box.insert(0, values[col])
+
+        if len(self.rows) > self.visible_rows:
+            self.scrollbar.grid(row=1, column=self.num_cols, rowspan=view_rows, padx=(0, 5), pady=5, sticky="ns")
+            self.scrollbar.set(self.first_row / len(self.rows), (self.first_row + view_rows) / len(self.rows))
+        else:
+            self.scrollbar.grid_remove()
+
+    def _store_cell(self, view_row, col):
+        """Copies an edited entry back into self.rows"""
+        row = self.first_row + view_row
+        if view_row < len(self.text_boxes) and row < len(self.rows):
+            self.rows[row][col] = self.text_boxes[view_row][col].get()
+
+    def _store_view(self):
+        """Copies every entry back into self.rows"""
+        # While a refresh is pending the entries still show the rows from before the last change
+        if self._refresh_id is not None:
+            return
+        for view_row, row_boxes in enumerate(self.text_boxes):
+            for col in range(len(row_boxes)):
+                self._store_cell(view_row, col)
+
+    def scroll_to(self, row):
+        """Scrolls so `row` is the first row shown"""
+        self._store_view()
+        self.first_row = row
+        self._refresh_view()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(round(float(amount) * len(self.rows)))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_to(self.first_row + int(amount) * step)
+
+    def _on_mouse_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.first_row - 1)
+        elif event.num == 5 or event.delta < 0:
+            self.scroll_to(self.first_row + 1)
+        return "break"
+
+    def append_row(self, key: str = "", value: str = ""):
+        """Adds a row to the end of the table"""
+        self.rows.append([key, value] + [""] * (self.num_cols - 2))
+        self.num_rows = len(self.rows)
+        self.schedule_refresh()
+
+    def remove_row(self, index: Optional[int] = None):
+        """Removes a row, the last one by default"""
+        if not self.rows:
+            return
+        self._store_view()
+        self.rows.pop(len(self.rows) - 1 if index is None else index)
+        self.num_rows = len(self.rows)
+        self.schedule_refresh()
+
+    def _on_paste(self, view_row, col):
+        """Pastes multi-line clipboard text (e.g. copied Excel cells) as rows, from the row pasted into"""
+        try:
+            text = self.clipboard_get()
+        except Exception:
+            return None
+        lines = text.strip("\r\n").splitlines()
+        if len(lines) < 2 and "\t" not in text:
+            return None  # Normal single value paste
+
+        self._store_view()
+        row = self.first_row + view_row
+        for line in lines:
+            cells = line.split("\t")
+            if row == len(self.rows):
+                self.rows.append([""] * self.num_cols)
+            for offset, cell in enumerate(cells[:self.num_cols - col]):
+                self.rows[row][col + offset] = cell
+            row += 1
+        self.num_rows = len(self.rows)
+        self.schedule_refresh()
+        return "break"
+
     def get_data(self) -> dict:
+        self._store_view()
         data = {}
-        for row in self.text_boxes:
-            key = row[0].get()
-            value = row[1].get()
+        for row in self.rows:
+            key = row[0]
+            value = row[1]
             if key:
                 data[key] = value
         return data
 
     def set_data(self, data: dict):
-        for i, (key, value) in enumerate(data.items()):
-            if i < self.num_rows:
-                self.text_boxes[i][0].insert(0, key)
-                self.text_boxes[i][1].insert(0, value)
+        """Replaces the table with `data` in one go, the entries are refreshed once"""
+        self.rows = [[key, value] + [""] * (self.num_cols - 2) for key, value in data.items()]
+        self.rows.extend([""] * self.num_cols for _ in range(self.num_rows - len(self.rows)))
+        self.num_rows = len(self.rows)
+        self.first_row = 0
+        self.schedule_refresh()
 
 
     def _draw(self, no_color_updates=False):
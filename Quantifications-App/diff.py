@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+
+import numpy
+import pandas
+
+import functions as fns  # Abstracted Functionality
+import engine
+import headers as hd
+import instrumentation as ins
+import cache as rc
+
+# Revision Diff Mode
+# ==================
+#
+# Each model revision re-exports the whole csv. Every run in this mode saves a snapshot of
+# the quantified rows keyed by GUID, with a hash of each raw row. The next revision only runs
+# rows that were added or whose raw data changed through the pipeline, patches the previous
+# Pivot Table totals, and reports what changed.
+
+SNAPSHOT_SUFFIX = " Snapshot.json"
+KEY_COLUMN = "_key"
+HASH_COLUMN = "_row_hash"
+
+CHANGES_SHEET_NAME = "Changes"
+ELEMENTS_SHEET_NAME = "Changed Elements"
+
+
+def _name_map_digest(name_map):
+    items = sorted((str(key), str(value)) for key, value in name_map.items())
+    return hashlib.sha1(json.dumps(items).encode("utf-8")).hexdigest()
+
+
+def row_keys(raw, index):
+    """Unique key per element: its GUID (or ID), numbered when an element appears more than once
+
+    Args:
+        raw (`pandas.DataFrame`): Raw export
+        index (`headers.HeaderIndex`): Headers of the export
+
+    Raises:
+        ValueError: If the export has no GUID or ID column
+
+    Returns:
+        `pandas.Series`: Keys like `<guid>#0`
+    """
+    header = index.find("guid") or index.find("id")
+    if header is None:
+        raise ValueError("Diff mode needs a GUID or ID column")
+
+    ids = raw.iloc[:, index.position(header)].astype(str)
+    return ids + "#" + ids.groupby(ids, sort=False).cumcount().astype(str)
+
+
+def row_hashes(raw):
+    """Hash of every raw row, to spot elements whose data changed
+
+    Args:
+        raw (`pandas.DataFrame`): Raw export
+
+    Returns:
+        `numpy.ndarray`: uint64 hash per row
+    """
+    # Compare as text, a column can be parsed as int in one revision and float in the next
+    return pandas.util.hash_pandas_object(raw.astype(str), index=False).to_numpy()
+
+
+def load_snapshot(path):
+    """Reads a snapshot written by `quantify_revision`
+
+    Args:
+        path (str): Snapshot json file
+
+    Returns:
+        tuple: (metadata dict, `pandas.DataFrame` of quantified rows with key and hash columns)
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        meta = json.load(file)
+    frame = rc.read_frame(os.path.join(os.path.dirname(path), meta["data"]))
+    return meta, frame
+
+
+def save_snapshot(path, frame, meta):
+    """Writes the quantified rows of a run next to its workbook
+
+    Args:
+        path (str): Snapshot json file
+        frame (`pandas.DataFrame`): Quantified rows with key and hash columns
+        meta (dict): Headers, name map digest and pipeline version of the run
+    """
+    base = path[:-len(".json")] if path.endswith(".json") else path
+    dataPath = rc.write_frame(frame, base)
+    meta = {**meta, "data": os.path.basename(dataPath)}
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+
+def _negate(summary):
+    return summary.assign(**{"mm": -summary["mm"], "No.": -summary["No."]})
+
+
+def change_report(before, after):
+    """Per item totals before and after, for the items whose totals changed
+
+    Args:
+        before (`pandas.DataFrame`): Previous `engine.combine_summaries` result
+        after (`pandas.DataFrame`): Patched summary
+
+    Returns:
+        `pandas.DataFrame`: Keys, before / after / change of mm and No.
+    """
+    keys = [column for column in after.columns if column not in ("mm", "No.")]
+    report = before.merge(after, on=keys, how="outer", suffixes=(" Before", " After"))
+    for column in ("mm", "No."):
+        report[[f"{column} Before", f"{column} After"]] = report[[f"{column} Before", f"{column} After"]].fillna(0)
+        report[f"{column} Change"] = report[f"{column} After"] - report[f"{column} Before"]
+
+    changed = (report["mm Change"].abs() > 1e-9) | (report["No. Change"] != 0)
+    return report[changed].sort_values(keys, na_position="last", ignore_index=True)
+
+
+def element_report(prev, frame, keys, positions, unchanged):
+    """Lists the added, removed and changed elements with their quantities before and after
+
+    Args:
+        prev (`pandas.DataFrame`): Previous snapshot
+        frame (`pandas.DataFrame`): New quantified rows, in export order
+        keys (`pandas.Series`): Keys of the new rows
+        positions (`numpy.ndarray`): Row of each new key in `prev`, -1 when added
+        unchanged (`numpy.ndarray`): True for rows whose raw data didn't change
+
+    Returns:
+        `pandas.DataFrame`: Key, Status, Name, Unistrut Length and Units before and after
+    """
+    index = hd.HeaderIndex(frame.columns, clean=False)
+    name = index.find("name")
+    unistrut = index.find("unistrut")
+    shown = [name, unistrut, engine.UNITS_HEADER]
+
+    added = positions < 0
+    changed = ~added & ~unchanged
+    removed = ~prev[KEY_COLUMN].isin(keys).to_numpy()
+
+    after = frame[shown].add_suffix(" After")
+    before = pandas.DataFrame(index=frame.index, columns=[f"{column} Before" for column in shown], dtype=object)
+    before.loc[changed] = prev[shown].iloc[positions[changed]].to_numpy()
+
+    current = pandas.concat([before, after], axis=1)
+    current.insert(0, "Status", numpy.where(added, "Added", "Changed"))
+    current.insert(0, "Element", keys.to_numpy())
+    current = current[added | changed]
+
+    gone = prev[removed][shown].add_suffix(" Before")
+    gone.insert(0, "Status", "Removed")
+    gone.insert(0, "Element", prev[KEY_COLUMN][removed].to_numpy())
+
+    return pandas.concat([current, gone], ignore_index=True)
+
+
+def quantify_revision(fileName, outputName="output_file", previous=None, name_map=None, progress=None, name_cache=None, pivot="static", units="values", sheet="table"):
+    """Quantifies a new revision of an export, only processing the rows that changed
+
+    Args:
+        fileName (str): Name of csv file
+        outputName (str, optional): Name of output file. Defaults to "output_file".
+        previous (str, optional): Snapshot of the previous revision's run, processes every row when `None`. Defaults to None.
+        name_map (dict, optional): Part code replacements. Defaults to `engine.DEFAULT_NAME_MAP`.
+        progress (callable, optional): Called with a number between 0 - 1. Defaults to None.
+        name_cache (`functions.NameCache`, optional): Cache of already cleaned names. Defaults to None.
+        pivot (str, optional): Pivot Table sheet, one of `engine.PIVOT_MODES`. Defaults to "static".
+        units (str, optional): Units column, one of `engine.UNITS_MODES`. Defaults to "values".
+        sheet (str, optional): Quantifications sheet, one of `engine.SHEET_MODES`. Defaults to "table".
+
+    Returns:
+        str: Path of the written xlsx file
+    """
+    report = progress or (lambda amount: None)
+    if name_map is None:
+        name_map = engine.DEFAULT_NAME_MAP
+
+    fns.log(f"Reading {fileName}")
+    index = hd.HeaderIndex.from_csv(fileName)
+    raw = engine.read_export(fileName, index)
+    index = index.project()
+    with ins.stage("compare", len(raw)):
+        keys = row_keys(raw, index)
+        hashes = row_hashes(raw)
+    meta = {"headers": index.headers, "name_map": _name_map_digest(name_map), "version": engine.PIPELINE_VERSION}
+    report(0.2)
+
+    prev = None
+    if previous is not None:
+        with ins.stage("snapshot"):
+            prevMeta, prev = load_snapshot(previous)
+        if any(prevMeta.get(field) != value for field, value in meta.items()):
+            fns.log("Previous snapshot used other columns, name rules or pipeline version, processing every row", 'warning')
+            prev = None
+
+    if prev is None:
+        positions = numpy.full(len(raw), -1)
+        unchanged = numpy.zeros(len(raw), dtype=bool)
+    else:
+        with ins.stage("compare"):
+            positions = pandas.Index(prev[KEY_COLUMN]).get_indexer(keys)
+            found = positions >= 0
+            unchanged = found.copy()
+            unchanged[found] = prev[HASH_COLUMN].to_numpy()[positions[found]] == hashes[found]
+
+    # Only new and changed rows go through the pipeline
+    fresh = engine.run_pipeline(raw[~unchanged].copy(), name_map, name_cache=name_cache, index=index)
+    report(0.5)
+
+    columns = list(fresh.columns)
+    if prev is not None:
+        reused = prev.iloc[positions[unchanged]][columns]
+        reused.index = numpy.flatnonzero(unchanged)
+        frame = pandas.concat([reused, fresh]).sort_index()
+    else:
+        frame = fresh
+    frame = frame.reset_index(drop=True)
+    fns.log(f"Reused {unchanged.sum()} rows, processed {len(fresh)} new or changed rows", 'message')
+
+    # Patch the previous totals: remove what removed / changed rows counted, add the fresh rows
+    summary = None
+    sheets = {}
+    if prev is not None:
+        with ins.stage("pivot", len(frame)):
+            stale = numpy.ones(len(prev), dtype=bool)
+            stale[positions[unchanged]] = False
+            before = engine.combine_summaries([engine.summarise(prev[columns])])
+            parts = [before, engine.summarise(fresh)]
+            if stale.any():
+                parts.append(_negate(engine.summarise(prev[columns][stale])))
+            summary = engine.combine_summaries(parts)
+            summary = summary[(summary["mm"].abs() > 1e-9) | (summary["No."] != 0)].reset_index(drop=True)
+
+            elements = element_report(prev, frame, keys, positions, unchanged)
+            sheets = {CHANGES_SHEET_NAME: change_report(before, summary), ELEMENTS_SHEET_NAME: elements}
+        fns.log(f"{(elements['Status'] == 'Added').sum()} added, {(elements['Status'] == 'Removed').sum()} removed, "
+                f"{(elements['Status'] == 'Changed').sum()} changed", 'message')
+    report(0.7)
+
+    outputPath = f'{outputName}.xlsx'
+    engine.write_workbook(frame, outputPath, pivot, units, summary=summary, extra_sheets=sheets, sheet=sheet)
+
+    # No progress until the snapshot is saved too, a cancel now would leave a workbook without one
+    with ins.stage("snapshot", len(frame)):
+        snapshot = frame.assign(**{KEY_COLUMN: keys.to_numpy(), HASH_COLUMN: hashes})
+        save_snapshot(outputName + SNAPSHOT_SUFFIX, snapshot, meta)
+    report(1.0)
+
+    return outputPath
+
+
+def compare_workbooks(previous, fileName, outputName="output_file", name_map=None, progress=None, name_cache=None, pivot="static", units="values", sheet="table"):
+    """Compares two Quantifications workbooks, e.g. revisions quantified before snapshots were kept
+
+    Both workbooks are read with `engine.read_quantifications`, so their names get the same rules.
+    Elements are matched on their GUID (or ID) and count as changed when any quantified value changed.
+
+    Args:
+        previous (str): Workbook of the previous revision
+        fileName (str): Workbook of the new revision
+        outputName (str, optional): Name of output file. Defaults to "output_file".
+        name_map (dict, optional): Part code replacements. Defaults to `engine.DEFAULT_NAME_MAP`.
+        progress (callable, optional): Called with a number between 0 - 1. Defaults to None.
+        name_cache (`functions.NameCache`, optional): Cache of already cleaned names. Defaults to None.
+        pivot (str, optional): Pivot Table sheet, one of `engine.PIVOT_MODES`. Defaults to "static".
+        units (str, optional): Units column, one of `engine.UNITS_MODES`. Defaults to "values".
+        sheet (str, optional): Quantifications sheet, one of `engine.SHEET_MODES`. Defaults to "table".
+
+    Raises:
+        ValueError: If a workbook has no GUID or ID column
+
+    Returns:
+        str: Path of the new revision's workbook, with the Changes and Changed Elements sheets
+    """
+    report = progress or (lambda amount: None)
+
+    fns.log(f"Reading {previous}")
+    prev = engine.read_quantifications(previous, name_map, name_cache, report)
+    report(0.3)
+    fns.log(f"Reading {fileName}")
+    frame = engine.read_quantifications(fileName, name_map, name_cache, report)
+    report(0.6)
+
+    columns = list(frame.columns)
+    with ins.stage("compare", len(frame)):
+        keys = row_keys(frame, hd.HeaderIndex(columns, clean=False))
+        prevKeys = row_keys(prev, hd.HeaderIndex(prev.columns, clean=False))
+        positions = pandas.Index(prevKeys).get_indexer(keys)
+        found = positions >= 0
+        unchanged = numpy.zeros(len(frame), dtype=bool)
+        # Workbooks with other columns can't be compared row by row, every found element counts as changed
+        if list(prev.columns) == columns:
+            unchanged[found] = row_hashes(prev).take(positions[found]) == row_hashes(frame)[found]
+
+    with ins.stage("pivot", len(frame)):
+        before = engine.combine_summaries([engine.summarise(prev)])
+        prev = prev.assign(**{KEY_COLUMN: prevKeys.to_numpy()})
+        summary = engine.combine_summaries([engine.summarise(frame)])
+        elements = element_report(prev, frame, keys, positions, unchanged)
+        sheets = {CHANGES_SHEET_NAME: change_report(before, summary), ELEMENTS_SHEET_NAME: elements}
+    fns.log(f"{(elements['Status'] == 'Added').sum()} added, {(elements['Status'] == 'Removed').sum()} removed, "
+            f"{(elements['Status'] == 'Changed').sum()} changed", 'message')
+    report(0.7)
+
+    outputPath = f'{outputName}.xlsx'
+    engine.write_workbook(frame, outputPath, pivot, units, summary=summary, extra_sheets=sheets, sheet=sheet)
+    report(1.0)
+
+    return outputPath
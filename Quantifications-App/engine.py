@@ -0,0 +1,739 @@
+import numpy
+import pandas
+
+import functions as fns  # Abstracted Functionality
+import headers as hd
+import instrumentation as ins
+
+# Quantification Engine
+# =====================
+#
+# Python port of the 0.9.5 Office Script (0-9-5_Pricing_Pack_Quantification.osts).
+# Every stage works on whole columns at once instead of looping over rows, so
+# large Navisworks exports don't hit the Excel Online script timeouts.
+
+PIPELINE_VERSION = "0.9.5"
+
+SHEET_NAME = "Quantifications"
+PIVOT_SHEET_NAME = "Pivot Table"
+UNITS_HEADER = "Units (mm/No.)"
+
+# Pivot Table sheet: "static" values, "live" SUMIFS/COUNTIFS formulas, or None to skip it
+PIVOT_MODES = ("static", "live", None)
+
+# Units column: plain "values", or a non-volatile "formula" on the Unistrut Length cell of the same row
+UNITS_MODES = ("values", "formula")
+
+# Quantifications sheet: an Excel "table", or a plain auto"filter" which needs far less memory to
+# write. xlsxwriter keeps a record of every table cell (about 150 bytes each, 400 MB for 200k rows
+# of 14 columns) to check for overlaps. Streamed sheets always get an autofilter.
+SHEET_MODES = ("table", "filter")
+
+# Quantifications sheet finishing, see `finish_sheet`
+TABLE_NAME = "Quantifications"
+TABLE_STYLE = "Table Style Medium 2"  # What `workbook.addTable` uses
+HEADER_HEIGHT = 25
+FILTER_BUTTON_WIDTH = 3  # Characters the autofilter button covers in a header cell
+MAX_COLUMN_WIDTH = 60
+
+# Rows read at a time from a Quantifications workbook, see `read_quantifications`
+WORKBOOK_CHUNKSIZE = 100000
+
+# Streamed chunk summaries are added up into one every this many chunks, so they don't grow with the file
+SUMMARY_CHUNKS = 8
+
+# Rows quantified and handed to the preview first, see `quantify_csv`
+PREVIEW_ROWS = 2000
+# Rows per chunk when a preview is asked for without a chunk size
+PREVIEW_CHUNKSIZE = 50000
+
+# NOTE: These are specific for some parts (M12 -> M10) and the list below should be double checked often to keep it updated!
+DEFAULT_NAME_MAP = {
+    'P1428-H-': 'M1116',
+    'M12': 'M10',
+    'P1062': 'P1020',
+}
+
+# Text columns from the legend that get control characters removed
+TEXT_COLUMNS = ["Category", "Location", "Name", "Size", "Service type", "Raceway Name", "Raceway Ref. Number"]
+
+# Declared column types, see `read_export` and `apply_schema`. Repeated text is stored as
+# categories, GUIDs as Arrow strings and the merged lengths / angles as float32, instead of
+# one Python string object per cell.
+CATEGORY_COLUMNS = [*TEXT_COLUMNS, "Rod Length", UNITS_HEADER]
+FLOAT_COLUMNS = ["Unistrut Length", "Angle"]
+GUID_COLUMN = "GUID"
+
+
+def guid_type():
+    """Arrow backed strings for GUIDs, or pandas' own string type without pyarrow"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "string"
+    return "string[pyarrow]"
+
+
+def column_type(header):
+    """Declared type of a cleaned header when it is read from the csv
+
+    Length columns still hold text like "1200 mm" at this point, they are read as
+    categories and only become float32 once merged into Unistrut Length.
+
+    Args:
+        header (str): Cleaned header
+
+    Returns:
+        str: "category" or the GUID string type, `None` to let pandas infer the type
+    """
+    lowered = header.lower()
+    if lowered == GUID_COLUMN.lower():
+        return guid_type()
+    if lowered in _categoryKeys or "length" in lowered:
+        return "category"
+    return None
+
+
+_categoryKeys = {column.lower() for column in CATEGORY_COLUMNS}
+_floatKeys = {column.lower() for column in FLOAT_COLUMNS}
+
+
+def export_types(index):
+    """`pandas.read_csv` dtypes for the raw headers of an export
+
+    Args:
+        index (`headers.HeaderIndex`): Headers of the export
+
+    Returns:
+        dict: Raw header -> declared type
+    """
+    types = {}
+    for header in index.headers:
+        kind = column_type(header)
+        if kind is not None:
+            types[index.raw_header(header)] = kind
+    return types
+
+
+def read_export(fileName, index=None):
+    """Reads the pricing pack columns of a Navisworks csv export with the declared column types
+
+    Only the header row is read first, to pick the legend columns and their variants (exports
+    with every property have hundreds of columns) and work out their types, so the text columns
+    are never held as Python strings, and a missing required column fails before any rows are read.
+    Pass `index.project()` to `run_pipeline` along with the result.
+
+    Args:
+        fileName (str): Name of csv file
+        index (`headers.HeaderIndex`, optional): Headers of the export, read from the file when `None`. Defaults to None.
+
+    Raises:
+        headers.MissingColumnsError: If any required column is missing
+
+    Returns:
+        `pandas.DataFrame`: Raw export, with only the `index.selected` columns
+    """
+    if index is None:
+        index = hd.HeaderIndex.from_csv(fileName)
+    index.check()
+    selected = index.project()
+    with ins.stage("read") as stage:
+        frame = fns.read_csv_columns(fileName, selected.raw, export_types(selected), index.raw)
+        stage.rows = len(frame)
+    return frame
+
+
+def read_quantifications(fileName, name_map=None, name_cache=None, progress=None):
+    """Reads the Quantifications sheet of a workbook written by an earlier run
+
+    The sheet is streamed in chunks (see `functions.xlsx_chunks`) and every chunk goes through
+    `run_pipeline` like an export would, so names get the current rules, the Units column is
+    worked out again (formula cells have no saved value when xlsxwriter writes them) and the
+    columns get their declared types. The trailing " <number>" of a name was already removed by
+    the earlier run, so it isn't removed again (Strut Channel 41 stays Strut Channel 41).
+    The Pivot Table and other sheets are not read.
+
+    Args:
+        fileName (str): Name of xlsx file
+        name_map (dict, optional): Part code replacements. Defaults to `DEFAULT_NAME_MAP`.
+        name_cache (`functions.NameCache`, optional): Cache of already cleaned names, reused across runs. Defaults to None.
+        progress (callable, optional): Called with `None` after each chunk, so the run can be cancelled. Defaults to None.
+
+    Raises:
+        headers.MissingColumnsError: If any required column is missing
+        ValueError: If the workbook has no Quantifications sheet
+
+    Returns:
+        `pandas.DataFrame`: Quantifications table
+    """
+    import parallel
+
+    report = progress or (lambda amount: None)
+    chunks = fns.xlsx_chunks(fileName, SHEET_NAME, WORKBOOK_CHUNKSIZE)
+    index = None
+    parts = []
+    while True:
+        with ins.stage("read") as stage:
+            chunk = next(chunks, None)
+            stage.rows = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+
+        chunk = chunk.drop(columns=[header for header in chunk.columns if header == UNITS_HEADER])
+        if index is None:
+            # Every column is kept, e.g. the Source File column of a merged workbook
+            index = hd.HeaderIndex(chunk.columns)
+        # Numeric categories are worked out on the whole table, see `parallel.combine`
+        parts.append(run_pipeline(chunk, name_map, name_cache=name_cache, index=index, numbers=False, strip_numbers=False))
+        report(None)
+
+    return parallel.combine(parts) if len(parts) > 1 else apply_schema(parts[0])
+
+
+def _as_float32(column):
+    if column.dtype == "float32":
+        return column
+    numbers = fns.to_numbers(column)
+    if (numpy.isnan(numbers) & column.notna().to_numpy()).any():
+        # Keep text that isn't a number rather than losing it
+        return column
+    return pandas.Series(numbers.astype("float32"), index=column.index, name=column.name)
+
+
+def apply_schema(frame, numbers=True):
+    """Converts the legend columns of a Quantifications table to their declared types in place
+
+    Args:
+        frame (`pandas.DataFrame`): Table with cleaned headers
+        numbers (bool, optional): Categories that are all numbers become numbers, `False` for parts of
+            a table that are combined first, see `parallel.quantify_chunks`. Defaults to True.
+
+    Returns:
+        `pandas.DataFrame`: The same frame
+    """
+    for header in frame.columns:
+        lowered = header.lower()
+        column = frame[header]
+        if lowered in _floatKeys:
+            frame[header] = _as_float32(column)
+        elif lowered in _categoryKeys:
+            if not isinstance(column.dtype, pandas.CategoricalDtype):
+                column = column.astype("category")
+            frame[header] = fns.numeric_categories(column) if numbers else column
+        elif lowered == GUID_COLUMN.lower() and column.dtype != guid_type():
+            frame[header] = column.astype(guid_type())
+    return frame
+
+
+def excel_values(frame):
+    """Copy of a table with float32 columns widened for writing, so 333.3 isn't written as 333.29998779296875
+
+    Args:
+        frame (`pandas.DataFrame`): Quantifications table
+
+    Returns:
+        `pandas.DataFrame`: Table to write
+    """
+    floats = [header for header in frame.columns if frame[header].dtype == "float32"]
+    if not floats:
+        return frame
+    frame = frame.copy()
+    for header in floats:
+        frame[header] = fns.widen_floats(frame[header])
+    return frame
+
+
+def normalise_names(names, name_map, name_cache=None, strip_numbers=True):
+    """Applies the name map and removes a trailing " <number>" from each name
+
+    Casework 2 -> Casework, but MIDAS_Plate_2 -> MIDAS_Plate_2
+
+    Args:
+        names (`pandas.Series`): Name column
+        name_map (dict): Part code replacements
+        name_cache (`functions.NameCache`, optional): Cache of already cleaned names. Defaults to None.
+        strip_numbers (bool, optional): Remove the trailing " <number>", `False` for names that were
+            already normalised, e.g. read back from a workbook. Defaults to True.
+
+    Returns:
+        `pandas.Series`: Normalised names
+    """
+    if name_cache is None:
+        name_cache = fns.NameCache()
+    return name_cache.update(names, name_map, strip_numbers)
+
+
+def variant_columns(headers, keyword, exclude=()):
+    """Lists the headers containing a keyword, e.g. every Length / length / Length 2 column
+
+    Args:
+        headers (str[]): Cleaned headers
+        keyword (str): Lowercase keyword
+        exclude (str[], optional): Lowercase words that rule a header out. Defaults to ().
+
+    Returns:
+        str[]: Matching headers in column order
+    """
+    matches = []
+    for header in headers:
+        lowered = header.lower()
+        if keyword in lowered and not any(word in lowered for word in exclude):
+            matches.append(header)
+    return matches
+
+
+def merge_lengths(frame, unistrut, lengths=None):
+    """Merges every length column into the Unistrut Length column
+
+    The last other length (in column order) above 1 wins, the Unistrut Length itself is only kept
+    when no other length is above 1, wherever its column is. That is what the 0.9.5 Office Script
+    ends up with: it writes each length above 1 into the Unistrut cell as it goes, so by the time
+    it reaches the Unistrut Length column an earlier length has already replaced its value, and a
+    later one replaces it afterwards. `benchmark.check_length_parity` compares the two.
+    Rod Length is kept as its own column as per the legend, the script merges it too.
+
+    Args:
+        frame (`pandas.DataFrame`): Export with cleaned headers
+        unistrut (str): Unistrut Length header
+        lengths (str[], optional): Length variant headers, `headers.HeaderIndex.lengths`. Defaults to every length header but Rod Length.
+
+    Returns:
+        str[]: Merged length headers (excluding Unistrut Length)
+    """
+    if lengths is None:
+        lengths = [header for header in variant_columns(frame.columns, "length", exclude=("rod",)) if header != unistrut]
+
+    # The Unistrut Length itself is only kept when no other length is above 1
+    merged = fns.merge_columns([frame[header] for header in lengths], " mm", index=frame.index)
+    original = pandas.Series(fns.to_numbers(frame[unistrut], " mm"), index=frame.index)
+
+    # Fill blank cells in Unistrut column with 1
+    frame[unistrut] = merged.fillna(original).fillna(1)
+    return lengths
+
+
+def merge_angles(frame, angle, angles=None):
+    """Merges every other angle column into the Angle column
+
+    Args:
+        frame (`pandas.DataFrame`): Export with cleaned headers
+        angle (str): Angle header
+        angles (str[], optional): Angle variant headers, `headers.HeaderIndex.angles`. Defaults to every other angle header.
+
+    Returns:
+        str[]: Merged angle headers (excluding Angle)
+    """
+    if angles is None:
+        angles = [header for header in variant_columns(frame.columns, "angle") if header != angle]
+    if angles:
+        merged = fns.merge_columns([frame[header] for header in angles], None)
+        frame[angle] = frame[angle].mask(merged.notna(), merged)
+    return angles
+
+
+def add_units_column(frame, unistrut, angle):
+    """Inserts the Units (mm/No.) column in front of the Angle column
+
+    Args:
+        frame (`pandas.DataFrame`): Export with merged lengths
+        unistrut (str): Unistrut Length header
+        angle (str): Angle header
+    """
+    units = pandas.Categorical.from_codes((~(frame[unistrut].to_numpy() > 1)).astype("int8"), ["mm", "No."])
+    frame.insert(frame.columns.get_loc(angle), UNITS_HEADER, units)
+
+
+def units_as_formulas(frame):
+    """Replaces the Units values with `=IF(<Unistrut Length cell>>1,"mm","No.")` formulas
+
+    Unlike the Office Script's `INDIRECT(ADDRESS(...))` these only reference the cell next to them,
+    so Excel only recalculates a row when its Unistrut Length changes.
+    The frame index (the csv row) is used as the row number, so chunks keep their place in the file.
+
+    Args:
+        frame (`pandas.DataFrame`): Quantifications table
+
+    Returns:
+        `pandas.DataFrame`: Copy of the table with formula strings in the Units column
+    """
+    from xlsxwriter.utility import xl_col_to_name
+
+    letter = xl_col_to_name(frame.columns.get_loc(hd.HeaderIndex(frame.columns, clean=False).find("unistrut")))
+    # Row 1 is the header
+    rows = frame.index.to_numpy() + 2
+
+    frame = frame.copy()
+    frame[UNITS_HEADER] = [f'=IF({letter}{row}>1,"mm","No.")' for row in rows]
+    return frame
+
+
+def run_pipeline(frame, name_map=None, progress=None, name_cache=None, index=None, numbers=True, strip_numbers=True):
+    """Runs the 0.9.5 quantification on a raw Navisworks export
+
+    Args:
+        frame (`pandas.DataFrame`): Raw export
+        name_map (dict, optional): Part code replacements. Defaults to `DEFAULT_NAME_MAP`.
+        progress (callable, optional): Called with a number between 0 - 1 after each stage. Defaults to None.
+        name_cache (`functions.NameCache`, optional): Cache of already cleaned names, reused across runs. Defaults to None.
+        index (`headers.HeaderIndex`, optional): Index of the frame's raw headers, e.g. shared by every chunk of a file. Defaults to None.
+        numbers (bool, optional): Passed to `apply_schema`. Defaults to True.
+        strip_numbers (bool, optional): Passed to `normalise_names`. Defaults to True.
+
+    Raises:
+        headers.MissingColumnsError: If any required column is missing
+
+    Returns:
+        `pandas.DataFrame`: Quantifications table
+    """
+    if name_map is None:
+        name_map = DEFAULT_NAME_MAP
+    report = progress or (lambda amount: None)
+
+    if index is None:
+        index = hd.HeaderIndex(frame.columns)
+    name, unistrut, angle = index.check()
+    rows = len(frame)
+    with ins.stage("headers", rows):
+        frame.columns = index.headers
+        fns.sanitise_columns(frame, TEXT_COLUMNS)
+    report(0.2)
+
+    with ins.stage("names", rows):
+        frame[name] = normalise_names(frame[name], name_map, name_cache, strip_numbers)
+    report(0.4)
+
+    with ins.stage("merge", rows):
+        merge_lengths(frame, unistrut, index.lengths)
+        merge_angles(frame, angle, index.angles)
+        frame = frame.drop(columns=index.merged)
+    report(0.6)
+
+    with ins.stage("units", rows):
+        add_units_column(frame, unistrut, angle)
+        apply_schema(frame, numbers)
+    report(0.7)
+
+    return frame
+
+
+def summarise(frame):
+    """Totals per Name / Size / Service type, split by units, like the Excel pivot table
+
+    mm rows are summed by Unistrut Length, No. rows are counted.
+
+    Args:
+        frame (`pandas.DataFrame`): Quantifications table
+
+    Returns:
+        `pandas.DataFrame`: One row per Name / Size / Service type with `mm` and `No.` totals
+    """
+    index = hd.HeaderIndex(frame.columns, clean=False)
+    keys = [header for header in (index.find("name"), index.find("size"), index.find("service type")) if header]
+    unistrut = index.find("unistrut")
+
+    isMm = (frame[UNITS_HEADER] == "mm").to_numpy()
+    lengths = frame[unistrut]
+    if lengths.dtype == "float32":
+        lengths = fns.widen_floats(lengths)
+    totals = frame[keys].copy()
+    totals["mm"] = numpy.where(isMm, lengths.to_numpy(dtype="float64"), 0.0)
+    totals["No."] = (~isMm).astype("int64")
+
+    # Hash based groupby, sorting is left to combine_summaries
+    summary = totals.groupby(keys, sort=False, dropna=False, observed=True)[["mm", "No."]].sum().reset_index()
+
+    # Chunks have their own categories, plain values combine and sort the same way
+    for key in keys:
+        if isinstance(summary[key].dtype, pandas.CategoricalDtype):
+            summary[key] = summary[key].astype(object)
+    return summary
+
+
+def combine_summaries(summaries):
+    """Adds up summaries of separate chunks and sorts them like the pivot table
+
+    Args:
+        summaries (`pandas.DataFrame`[]): Results of `summarise`
+
+    Returns:
+        `pandas.DataFrame`: Combined summary
+    """
+    summary = pandas.concat(summaries, ignore_index=True)
+    keys = [column for column in summary.columns if column not in ("mm", "No.")]
+    if len(summaries) > 1:
+        summary = summary.groupby(keys, sort=False, dropna=False)[["mm", "No."]].sum().reset_index()
+    return summary.sort_values(keys, na_position="last", ignore_index=True)
+
+
+def write_pivot_sheet(workbook, summary, headers, mode="static"):
+    """Writes the summary to the Pivot Table sheet
+
+    Neither xlsx writer can create a real pivot table, so the "live" mode writes SUMIFS/COUNTIFS
+    formulas over the Quantifications sheet instead. They update when the data is edited and
+    don't need a pivot cache refresh.
+
+    Args:
+        workbook (`xlsxwriter.Workbook`): Output workbook
+        summary (`pandas.DataFrame`): Result of `combine_summaries`
+        headers (str[]): Headers of the Quantifications sheet
+        mode (str, optional): "static" or "live". Defaults to "static".
+    """
+    from xlsxwriter.utility import xl_col_to_name, xl_rowcol_to_cell
+
+    worksheet = workbook.add_worksheet(PIVOT_SHEET_NAME)
+    keys = [column for column in summary.columns if column not in ("mm", "No.")]
+    worksheet.write_row(0, 0, [*keys, "mm", "No."])
+
+    def column_range(header):
+        letter = xl_col_to_name(headers.index(header))
+        return f"'{SHEET_NAME}'!${letter}:${letter}"
+
+    unistrut = column_range(hd.HeaderIndex(headers, clean=False).find("unistrut"))
+    units = column_range(UNITS_HEADER)
+    keyRanges = [column_range(key) for key in keys]
+
+    values = summary.astype(object).where(summary.notna(), None)
+    for row, record in enumerate(values.itertuples(index=False, name=None), start=1):
+        *keyValues, mm, number = record
+        worksheet.write_row(row, 0, keyValues)
+        if mode != "live":
+            worksheet.write_row(row, len(keys), [mm, number])
+            continue
+
+        # Blank keys have to match blank cells, a reference to an empty cell would match 0
+        cells = [xl_rowcol_to_cell(row, col, col_abs=True) if value is not None else '""' for col, value in enumerate(keyValues)]
+        criteria = ",".join(f"{keyRange},{cell}" for keyRange, cell in zip(keyRanges, cells))
+        worksheet.write_formula(row, len(keys), f'=SUMIFS({unistrut},{criteria},{units},"mm")', None, mm)
+        worksheet.write_formula(row, len(keys) + 1, f'=COUNTIFS({criteria},{units},"No.")', None, number)
+
+
+def _centred(workbook):
+    # Identical formats share one style record in the xlsx
+    return workbook.add_format({"align": "center", "valign": "vcenter"})
+
+
+def prepare_sheet(workbook, worksheet, columns):
+    """Header row height, frozen header and centred columns, set before any row is written
+
+    Cells without a format of their own take the format of their column, but only while
+    their row hasn't been written yet in constant memory mode.
+
+    Args:
+        workbook (`xlsxwriter.Workbook`): Output workbook
+        worksheet (`xlsxwriter.Worksheet`): Quantifications sheet
+        columns (int): Number of columns, or more when it isn't known yet
+    """
+    worksheet.set_row(0, HEADER_HEIGHT)
+    worksheet.freeze_panes(1, 0)
+    worksheet.set_column(0, columns - 1, None, _centred(workbook))
+
+
+def finish_sheet(workbook, worksheet, headers, rows, widths, table=True):
+    """Formats the Quantifications sheet once its rows are written
+
+    Does what the Office Script does with `addTable`, `getAutoFilter().apply`, `autofitColumns`
+    and the table range alignment, as a handful of records in the xlsx instead of a format per
+    cell: an Excel table (with its autofilter), and one centred format and width per column.
+
+    Args:
+        workbook (`xlsxwriter.Workbook`): Output workbook
+        worksheet (`xlsxwriter.Worksheet`): Quantifications sheet, after `prepare_sheet`
+        headers (str[]): Headers of the sheet
+        rows (int): Data rows written
+        widths (int[]): Characters per column, see `functions.column_widths`
+        table (bool, optional): Add an Excel table, a plain autofilter when `False`, see `SHEET_MODES`.
+            xlsxwriter can't add tables in constant memory mode. Defaults to True.
+    """
+    centred = _centred(workbook)
+    for col, width in enumerate(widths):
+        worksheet.set_column(col, col, min(width + FILTER_BUTTON_WIDTH, MAX_COLUMN_WIDTH), centred)
+
+    lastCol = len(headers) - 1
+    if not table:
+        worksheet.autofilter(0, 0, rows, lastCol)
+        return
+    # A table needs a data row, even an empty one
+    worksheet.add_table(0, 0, max(rows, 1), lastCol, {
+        "name": TABLE_NAME,
+        "style": TABLE_STYLE,
+        "columns": [{"header": str(header)} for header in headers],
+    })
+
+
+def quantify_csv(fileName, outputName="output_file", name_map=None, progress=None, chunksize=None, name_cache=None, pivot="static", units="values", cache=None, workers=1, preview=None, sheet="table"):
+    """Generates the Quantifications xlsx file from a Navisworks csv export
+
+    With `preview` set the export is streamed, and the first `PREVIEW_ROWS` rows are read and
+    quantified on their own and handed to `preview` before the rest of the export is read. The
+    stream carries on after them, so no row is read twice.
+
+    Args:
+        fileName (str): Name of csv file
+        outputName (str, optional): Name of output file. Defaults to "output_file".
+        name_map (dict, optional): Part code replacements. Defaults to `DEFAULT_NAME_MAP`.
+        progress (callable, optional): Called with a number between 0 - 1. Defaults to None.
+        chunksize (int, optional): Stream the csv this many rows at a time to keep memory bounded. Defaults to None.
+        name_cache (`functions.NameCache`, optional): Cache of already cleaned names, reused across runs. Defaults to None.
+        pivot (str, optional): Pivot Table sheet, one of `PIVOT_MODES`. Defaults to "static".
+        units (str, optional): Units column, one of `UNITS_MODES`. Defaults to "values".
+        cache (`cache.ResultCache`, optional): Reuses the quantified table of an unchanged export, not used when streaming. Defaults to None.
+        workers (int, optional): Processes quantifying parts of the export, one per core for large exports when `None`
+            (see `parallel.worker_count`), not used when streaming. Defaults to 1.
+        preview (callable, optional): Called once with the first quantified rows (`pandas.DataFrame`) and the
+            roles of the export's columns (`headers.HeaderIndex.describe`), streams the export in chunks of
+            `chunksize` or `PREVIEW_CHUNKSIZE` rows. Defaults to None.
+        sheet (str, optional): Quantifications sheet, one of `SHEET_MODES`, streamed sheets always get an autofilter. Defaults to "table".
+
+    Returns:
+        str: Path of the written xlsx file
+    """
+    report = progress or (lambda amount: None)
+    if name_cache is None:
+        name_cache = fns.NameCache()
+    outputPath = f'{outputName}.xlsx'
+
+    # Reads only the header row, so a missing column fails before any rows are read
+    index = hd.HeaderIndex.from_csv(fileName)
+    index.check()
+    selected = index.project()
+
+    summaries = []
+    headers = []
+    widths = []
+    written = [0]
+
+    def transform(chunk):
+        chunk = run_pipeline(chunk, name_map, name_cache=name_cache, index=selected)
+        if preview is not None and not headers:
+            # A copy, the preview is shown on another thread while the chunk is written
+            preview(chunk.copy(), index.describe())
+        headers[:] = list(chunk.columns)
+        with ins.stage("write"):
+            # The widest value of any chunk
+            widths[:] = [max(pair) for pair in zip(widths, fns.column_widths(chunk))] if widths else fns.column_widths(chunk)
+            written[0] += len(chunk)
+        if pivot is not None:
+            with ins.stage("pivot", len(chunk)):
+                summaries.append(summarise(chunk))
+                if len(summaries) >= SUMMARY_CHUNKS:
+                    summaries[:] = [combine_summaries(summaries)]
+        if units == "formula":
+            chunk = units_as_formulas(chunk)
+        return excel_values(chunk)
+
+    def finalize(workbook):
+        if headers:
+            with ins.stage("write"):
+                finish_sheet(workbook, workbook.get_worksheet_by_name(SHEET_NAME), headers, written[0], widths, table=False)
+        if summaries:
+            with ins.stage("pivot"):
+                write_pivot_sheet(workbook, combine_summaries(summaries), headers, pivot)
+
+    fns.log(f"Reading {fileName}")
+    if preview is not None and chunksize is None:
+        chunksize = PREVIEW_CHUNKSIZE
+    if chunksize is not None:
+        # Every stage only looks at one row at a time, so chunks can be quantified independently
+        fns.convert_csv_file(fileName, outputName, chunksize=chunksize, sheetName=SHEET_NAME, transform=transform, finalize=finalize,
+                             progress=lambda amount: report(amount * 0.95), dtype=export_types(selected), usecols=selected.raw,
+                             # The pipeline adds the Units column, and only removes columns otherwise
+                             prepare=lambda workbook, worksheet: prepare_sheet(workbook, worksheet, len(selected.headers) + 1),
+                             first=PREVIEW_ROWS if preview is not None else None)
+        report(1.0)
+        return outputPath
+
+    frame = None
+    if cache is not None:
+        with ins.stage("cache"):
+            key = cache.key(fileName, DEFAULT_NAME_MAP if name_map is None else name_map, PIPELINE_VERSION)
+            frame = cache.get(key)
+        if frame is not None:
+            # Parquet doesn't keep every declared type, e.g. numeric categories
+            frame = apply_schema(frame)
+            fns.log(f"Using cached result for {fileName}", 'message')
+
+    if frame is None:
+        if workers != 1:
+            import parallel
+            workers = parallel.worker_count(fileName, workers)
+        if workers > 1:
+            frame = parallel.quantify_chunks(fileName, index, name_map, workers, lambda amount: report(amount * 0.8))
+        else:
+            frame = read_export(fileName, index)
+            report(0.1)
+
+            frame = run_pipeline(frame, name_map, progress, name_cache, selected)
+        fns.log(f"Quantified {len(frame)} rows", 'message')
+        if cache is not None:
+            with ins.stage("cache"):
+                cache.put(key, frame)
+    report(0.8)
+
+    write_workbook(frame, outputPath, pivot, units, sheet=sheet)
+    report(1.0)
+
+    return outputPath
+
+
+def quantify_workbook(fileName, outputName="output_file", name_map=None, progress=None, name_cache=None, pivot="static", units="values", sheet="table"):
+    """Quantifies a Quantifications workbook of an earlier run again, e.g. with new name rules
+
+    Args:
+        fileName (str): Name of xlsx file
+        outputName (str, optional): Name of output file. Defaults to "output_file".
+        name_map (dict, optional): Part code replacements. Defaults to `DEFAULT_NAME_MAP`.
+        progress (callable, optional): Called with a number between 0 - 1. Defaults to None.
+        name_cache (`functions.NameCache`, optional): Cache of already cleaned names, reused across runs. Defaults to None.
+        pivot (str, optional): Pivot Table sheet, one of `PIVOT_MODES`. Defaults to "static".
+        units (str, optional): Units column, one of `UNITS_MODES`. Defaults to "values".
+        sheet (str, optional): Quantifications sheet, one of `SHEET_MODES`. Defaults to "table".
+
+    Returns:
+        str: Path of the written xlsx file
+    """
+    report = progress or (lambda amount: None)
+    outputPath = f'{outputName}.xlsx'
+
+    fns.log(f"Reading {fileName}")
+    frame = read_quantifications(fileName, name_map, name_cache, report)
+    fns.log(f"Quantified {len(frame)} rows", 'message')
+    report(0.8)
+
+    write_workbook(frame, outputPath, pivot, units, sheet=sheet)
+    report(1.0)
+
+    return outputPath
+
+
+def write_workbook(frame, outputPath, pivot="static", units="values", summary=None, extra_sheets=None, sheet="table"):
+    """Writes a Quantifications table and its Pivot Table sheet to an xlsx file
+
+    Args:
+        frame (`pandas.DataFrame`): Quantifications table, with a 0..n index
+        outputPath (str): Path of the xlsx file
+        pivot (str, optional): Pivot Table sheet, one of `PIVOT_MODES`. Defaults to "static".
+        units (str, optional): Units column, one of `UNITS_MODES`. Defaults to "values".
+        summary (`pandas.DataFrame`, optional): Precomputed `combine_summaries` result for the Pivot Table sheet. Defaults to None.
+        extra_sheets (dict, optional): Sheet name -> `pandas.DataFrame` written after the Pivot Table. Defaults to None.
+        sheet (str, optional): Quantifications sheet, one of `SHEET_MODES`. Defaults to "table".
+    """
+    if pivot is not None and summary is None:
+        with ins.stage("pivot", len(frame)):
+            summary = combine_summaries([summarise(frame)])
+    headers = list(frame.columns)
+
+    with ins.stage("write", len(frame)):
+        widths = fns.column_widths(frame)
+        if units == "formula":
+            frame = units_as_formulas(frame)
+        frame = excel_values(frame)
+
+        with pandas.ExcelWriter(outputPath, engine="xlsxwriter") as writer:
+            frame.to_excel(writer, sheet_name=SHEET_NAME, index=False, header=True)
+            worksheet = writer.sheets[SHEET_NAME]
+            prepare_sheet(writer.book, worksheet, len(headers))
+            finish_sheet(writer.book, worksheet, headers, len(frame), widths, table=sheet == "table")
+            if pivot is not None:
+                write_pivot_sheet(writer.book, summary, headers, pivot)
+            for sheetName, extra in (extra_sheets or {}).items():
+                extra.to_excel(writer, sheet_name=sheetName, index=False, header=True)
@@ -1,7 +1,18 @@
-import pandas
+import csv
+import functools
+import os
+import re
+import time
+
+import instrumentation as ins
+
+# numpy, pandas and xlsxwriter are imported by the functions that use them, so light modules
+# (headers, jobs, mappings, the command line) don't pay for them at start up
 
 logging = True
 
+EXCEL_MAX_ROWS = 1048576
+
 class logColors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -37,49 +48,774 @@ def log(msg, status='log'):
                 print(logColors.FAIL + "ERROR: " + msg + logColors.ENDC)
                 
 
-def convert_csv_file(fileName, outputName="output_file"):
+def read_csv_header(fileName):
+    """Reads only the header row of a csv
+
+    Repeated headers are numbered and blank ones named like `pandas.read_csv` does it
+    ("Length", "Length.1", "Unnamed: 3"), without importing pandas.
+
+    Args:
+        fileName (str): Name of csv file
+
+    Returns:
+        str[]: Headers
+    """
+    with open(fileName, "r", encoding="utf-8-sig", newline="") as file:
+        row = next(csv.reader(file), [])
+
+    headers = [header or f"Unnamed: {position}" for position, header in enumerate(row)]
+    counts = {}
+    for position, original in enumerate(headers):
+        header = original
+        count = counts.get(original, 0)
+        while count > 0:
+            counts[original] = count + 1
+            header = f"{original}.{count}"
+            # Skip numbers taken by a header further along, e.g. a real "Length.1"
+            count = count + 1 if header in headers else counts.get(header, 0)
+        headers[position] = header
+        counts[header] = count + 1
+    return headers
+
+
+def _read_arrow_csv(source, names, usecols=None, columnTypes=None, header=True):
+    """Parses a csv with pyarrow, with the options `read_csv_columns` and `csv_column_types` share"""
+    from pyarrow import csv as arrowCsv
+
+    return arrowCsv.read_csv(
+        source,
+        # The numbered names tell repeated headers apart
+        read_options=arrowCsv.ReadOptions(column_names=names, skip_rows=1 if header else 0),
+        parse_options=arrowCsv.ParseOptions(newlines_in_values=True),
+        convert_options=arrowCsv.ConvertOptions(include_columns=usecols, column_types=columnTypes or {},
+                                                strings_can_be_null=True, quoted_strings_can_be_null=True),
+    )
+
+
+def _file_order(names, usecols):
+    # pyarrow keeps the requested order, pandas keeps the file order
+    wanted = set(usecols)
+    return [name for name in names if name in wanted]
+
+
+def read_csv_columns(fileName, usecols=None, dtype=None, names=None, column_types=None, header=True, with_types=False):
+    """Reads only the given columns of a csv
+
+    Uses pyarrow's multithreaded csv reader when it is installed, pandas' C parser otherwise.
+    Navisworks puts line breaks inside quoted values, which `pandas.read_csv(engine="pyarrow")`
+    can't parse, so pyarrow is called directly with `newlines_in_values`.
+
+    Args:
+        fileName (str | file): Name of csv file, or a pyarrow readable buffer of part of one (needs `names` and pyarrow)
+        usecols (str[], optional): Headers to read, as returned by `read_csv_header`. Defaults to every column.
+        dtype (dict, optional): Header -> type, "category" columns are read as dictionaries. Defaults to None.
+        names (str[], optional): Result of `read_csv_header`, if it has been read already. Defaults to None.
+        column_types (dict, optional): Header -> Arrow type for columns that would be inferred, see `csv_column_types`. Defaults to None.
+        header (bool, optional): The csv starts with the header row, `False` for a part after it. Defaults to True.
+        with_types (bool, optional): Also return the Arrow type each column was read as (needs pyarrow). Defaults to False.
+
+    Returns:
+        `pandas.DataFrame`: The columns, in file order, and a dict of header -> `pyarrow.DataType` with `with_types`
+    """
+    import pandas
+
+    dtype = dtype or {}
+    try:
+        import pyarrow
+    except ImportError:
+        return pandas.read_csv(fileName, usecols=usecols, dtype=dtype)
+
+    if names is None:
+        names = read_csv_header(fileName)
+    if usecols is not None:
+        usecols = _file_order(names, usecols)
+
+    # Text is read as dictionaries (categoricals) or plain strings, everything else is inferred
+    columnTypes = {name: pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) if kind == "category" else pyarrow.string()
+                   for name, kind in dtype.items() if kind == "category" or str(kind).startswith("string")}
+    table = _read_arrow_csv(fileName, names, usecols, {**(column_types or {}), **columnTypes}, header)
+    frame = table.to_pandas()
+    others = {name: kind for name, kind in dtype.items() if kind != "category" and name in frame.columns}
+    if others:
+        frame = frame.astype(others)
+    if with_types:
+        return frame, {field.name: field.type for field in table.schema}
+    return frame
+
+
+def csv_column_types(fileName, usecols, names=None):
+    """Arrow types `read_csv_columns` infers for columns over the whole file
+
+    Parts of a file read on their own could infer other types (a column of numbers with text
+    further down), reading them with these types gives the same values as reading the whole file.
+
+    Args:
+        fileName (str): Name of csv file
+        usecols (str[]): Headers to infer the types of
+        names (str[], optional): Result of `read_csv_header`, if it has been read already. Defaults to None.
+
+    Returns:
+        dict: Header -> `pyarrow.DataType`
+    """
+    if not usecols:
+        return {}
+    if names is None:
+        names = read_csv_header(fileName)
+    schema = _read_arrow_csv(fileName, names, _file_order(names, usecols)).schema
+    return {field.name: field.type for field in schema}
+
+
+WORKBOOK_EXTENSIONS = (".xlsx", ".xlsm")
+
+
+def is_workbook(fileName):
+    """True for xlsx files, e.g. Quantifications workbooks of earlier runs"""
+    return str(fileName).lower().endswith(WORKBOOK_EXTENSIONS)
+
+
+def _calamine_rows(fileName, sheetName):
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_path(fileName)
+    if sheetName not in workbook.sheet_names:
+        raise ValueError(f"{fileName} has no {sheetName} sheet")
+    # Blank cells come back as empty strings
+    for row in workbook.get_sheet_by_name(sheetName).iter_rows():
+        yield [None if value == "" else value for value in row]
+
+
+def _openpyxl_rows(fileName, sheetName):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(fileName, read_only=True, data_only=True)
+    try:
+        if sheetName not in workbook.sheetnames:
+            raise ValueError(f"{fileName} has no {sheetName} sheet")
+        yield from workbook[sheetName].iter_rows(values_only=True)
+    finally:
+        # Read only workbooks keep the file open until closed
+        workbook.close()
+
+
+def xlsx_chunks(fileName, sheetName, chunksize, usecols=None):
+    """Reads a worksheet one chunk at a time, the first row being the headers
+
+    Uses python-calamine (a Rust xlsx reader) when it is installed, openpyxl in read only mode
+    otherwise. calamine loads the whole sheet into memory first but reads it far faster, openpyxl
+    streams the sheet's rows. Only the wanted columns of a chunk are kept.
+    Formula cells are read as the value last calculated by Excel.
+
+    Args:
+        fileName (str): Name of xlsx file
+        sheetName (str): Worksheet to read
+        chunksize (int): Rows per chunk
+        usecols (str[], optional): Only keep these columns. Defaults to every column.
+
+    Raises:
+        ValueError: If the workbook has no such sheet
+
+    Yields:
+        `pandas.DataFrame`: The next rows of the sheet, numbers and text as read. The first chunk is
+            always yielded, empty when the sheet has no rows.
+    """
+    import numpy
+    import pandas
+
+    try:
+        rows = _calamine_rows(fileName, sheetName)
+        headers = next(rows, None)
+    except ImportError:
+        rows = _openpyxl_rows(fileName, sheetName)
+        headers = next(rows, None)
+    headers = ["" if header is None else str(header) for header in headers or []]
+    # Trailing blank header cells of a sheet with extra formatting
+    while headers and not headers[-1]:
+        headers.pop()
+
+    names = [header for header in headers if header and (usecols is None or header in usecols)]
+    positions = [headers.index(name) for name in names]
+    width = len(headers)
+
+    def to_frame(records, start):
+        frame = pandas.DataFrame(records, columns=names, index=pandas.RangeIndex(start, start + len(records)))
+        # calamine reads every number as a float, whole numbers are read as integers like `pandas.read_csv` does
+        for name in frame.columns[(frame.dtypes == "float64").to_numpy()]:
+            column = frame[name].to_numpy()
+            if len(column) and not numpy.isnan(column).any() and (column == numpy.round(column)).all():
+                frame[name] = column.astype("int64")
+        return frame
+
+    chunk = []
+    start = 0
+    for row in rows:
+        if len(row) < width:
+            row = (*row, *[None] * (width - len(row)))
+        values = tuple(row[position] for position in positions)
+        # Blank rows below the table, e.g. left by deleting rows in Excel
+        if any(value is not None for value in values):
+            chunk.append(values)
+        if len(chunk) == chunksize:
+            yield to_frame(chunk, start)
+            start += len(chunk)
+            chunk = []
+    if chunk or not start:
+        yield to_frame(chunk, start)
+
+
+def convert_csv_file(fileName, outputName="output_file", chunksize=None, transform=None, sheetName="Sheet1", finalize=None, progress=None, dtype=None, usecols=None, prepare=None, first=None):
     """Converts a csv file to an xlsx file
 
+    With `chunksize` set the csv is streamed: it is read `chunksize` rows at a time and the rows
+    are written straight to a constant memory xlsx writer, so peak memory stays bounded by the
+    chunk size instead of the file size.
+
     Args:
         fileName (str): Name of csv file
         outputName (str, optional): Name of output file. Defaults to "output_file".
+        chunksize (int, optional): Rows per chunk, reads the whole file at once when `None`. Defaults to None.
+        transform (callable, optional): Applied to each `pandas.DataFrame` chunk before it is written. Defaults to None.
+        sheetName (str, optional): Name of the worksheet. Defaults to "Sheet1".
+        finalize (callable, optional): Called with the `xlsxwriter.Workbook` before it is closed, e.g. to add sheets. Defaults to None.
+        progress (callable, optional): Called with the fraction of the csv read after each chunk. Defaults to None.
+        dtype (dict, optional): Column types passed to `pandas.read_csv`. Defaults to None.
+        usecols (str[], optional): Only read these columns. Defaults to every column.
+        prepare (callable, optional): Called with the `xlsxwriter.Workbook` and worksheet before any row is written, e.g. to set row heights. Defaults to None.
+        first (int, optional): Rows of the first chunk when streaming, e.g. a small one for a quick preview. Defaults to `chunksize`.
+
+    Returns:
+        dict: `rows`, `seconds` and `rows_per_second` of the conversion
     """
-    read_file = pandas.read_csv(fileName)
-    read_file.to_excel(f'{outputName}.xlsx', index=None, header=True)
-    
+    import pandas
+
+    start = time.perf_counter()
+
+    if chunksize is None:
+        read_file = pandas.read_csv(fileName, dtype=dtype, usecols=usecols)
+        if transform is not None:
+            read_file = transform(read_file)
+        with pandas.ExcelWriter(f'{outputName}.xlsx', engine="xlsxwriter") as writer:
+            read_file.to_excel(writer, sheet_name=sheetName, index=None, header=True)
+            if prepare is not None:
+                prepare(writer.book, writer.sheets[sheetName])
+            if finalize is not None:
+                finalize(writer.book)
+        rows = len(read_file)
+    else:
+        rows = _stream_csv_to_xlsx(fileName, f'{outputName}.xlsx', chunksize, transform, sheetName, finalize, progress, dtype, usecols, prepare, first)
+
+    seconds = time.perf_counter() - start
+    stats = {"rows": rows, "seconds": seconds, "rows_per_second": rows / seconds if seconds else 0.0}
+    log(f"Converted {rows} rows in {seconds:.2f}s ({stats['rows_per_second']:,.0f} rows/s)", 'message')
+    return stats
+
+
+def csv_chunks(source, chunksize, dtype=None, usecols=None, first=None):
+    """Reads a csv one chunk at a time
+
+    Every chunk carries on from where the last one stopped, so a small first chunk (e.g. for a
+    preview) isn't read again as part of the next one.
+
+    Args:
+        source (str | file): csv file, or a binary file object to read from
+        chunksize (int): Rows per chunk
+        dtype (dict, optional): Column types passed to `pandas.read_csv`. Defaults to None.
+        usecols (str[], optional): Only read these columns. Defaults to every column.
+        first (int, optional): Rows of the first chunk. Defaults to `chunksize`.
+
+    Yields:
+        `pandas.DataFrame`: The next rows of the csv
+    """
+    import pandas
+
+    with pandas.read_csv(source, chunksize=chunksize, dtype=dtype, usecols=usecols) as reader:
+        size = first or chunksize
+        while True:
+            try:
+                chunk = reader.get_chunk(size)
+            except StopIteration:
+                return
+            yield chunk
+            size = chunksize
+
+
+def _stream_csv_to_xlsx(fileName, outputPath, chunksize, transform, sheetName, finalize=None, progress=None, dtype=None, usecols=None, prepare=None, first=None):
+    """Writes a csv to xlsx one chunk at a time, returns the number of data rows written"""
+    import xlsxwriter
+
+    size = os.path.getsize(fileName) or 1
+    workbook = xlsxwriter.Workbook(outputPath, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheetName)
+    if prepare is not None:
+        # Constant memory rows are final once written
+        prepare(workbook, worksheet)
+    row = 0
+    try:
+        with open(fileName, 'rb') as handle:
+            chunks = csv_chunks(handle, chunksize, dtype, usecols, first)
+            while True:
+                with ins.stage("read") as stage:
+                    chunk = next(chunks, None)
+                    stage.rows = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    break
+
+                if transform is not None:
+                    chunk = transform(chunk)
+                if row == 0:
+                    worksheet.write_row(0, 0, [str(header) for header in chunk.columns])
+                    row = 1
+                if row + len(chunk) > EXCEL_MAX_ROWS:
+                    raise ValueError(f"{fileName} has more rows than fit in one worksheet ({EXCEL_MAX_ROWS})")
+
+                # Blank cells are written as None, xlsxwriter skips them
+                with ins.stage("write", len(chunk)):
+                    values = chunk.astype(object).where(chunk.notna(), None)
+                    for record in values.itertuples(index=False, name=None):
+                        worksheet.write_row(row, 0, record)
+                        row += 1
+
+                if progress is not None:
+                    # The reader buffers ahead, so this is approximate
+                    progress(min(handle.tell() / size, 1.0))
+
+        if finalize is not None:
+            finalize(workbook)
+    finally:
+        with ins.stage("write"):
+            workbook.close()
+
+    return max(row - 1, 0)
+
+
+controlCharsTable = dict.fromkeys([*range(0x00, 0x20), *range(0x7F, 0xA0)])
+headerPrefixRegex = re.compile(r"Element|Item|Custom|KGE_", re.IGNORECASE)
+
 
 def removeControlCharacters(input):
-    """Filters control characters from a string using regex
-    
+    """Filters control characters (U+0000 - U+001F, U+007F - U+009F) from text
+
+    Strings are filtered with a precompiled `str.translate` table. For a `pandas.Series`
+    only the distinct values are filtered and the results are broadcast back to the rows.
+
+    Args:
+        input (str | `pandas.Series` | str[]): The Input text
+
+    Returns:
+        str | `pandas.Series` | str[]: The filtered text, same type as the input
+    """
+    if isinstance(input, str):
+        return input.translate(controlCharsTable)
+    if isinstance(input, (list, tuple)):
+        return [str(value).translate(controlCharsTable) for value in input]
+
+    import numpy
+    import pandas
+
+    if isinstance(input, pandas.Series) and isinstance(input.dtype, pandas.CategoricalDtype):
+        return map_categories(input, lambda values: [value.translate(controlCharsTable) if isinstance(value, str) else value for value in values])
+
+    if isinstance(input, pandas.Series):
+        codes, uniques = pandas.factorize(input)
+        cleaned = numpy.empty(len(uniques) + 1, dtype=object)
+        cleaned[:-1] = [value.translate(controlCharsTable) if isinstance(value, str) else value for value in uniques]
+
+        # Missing values have code -1, point them at a trailing NaN
+        cleaned[-1] = numpy.nan
+        return pandas.Series(cleaned[codes], index=input.index, name=input.name)
+
+    return [str(value).translate(controlCharsTable) for value in input]
+
+
+def map_categories(column, function, missing=None):
+    """Rewrites the categories of a categorical column, the rows keep their codes
+
+    Categories that end up equal are merged, so the result is still a valid categorical.
+
+    Args:
+        column (`pandas.Series`): Categorical column
+        function (callable): Called once with the list of categories, returns the new values in the same order
+        missing (optional): Value passed to `function` for missing rows, they stay missing when `None`. Defaults to None.
+
+    Returns:
+        `pandas.Series`: Categorical column of the rewritten values
+    """
+    import numpy
+    import pandas
+
+    categories = list(column.cat.categories)
+    codes = column.cat.codes.to_numpy()
+    if missing is not None:
+        categories.append(missing)
+        codes = numpy.where(codes < 0, len(categories) - 1, codes)
+
+    newCodes, uniques = pandas.factorize(pandas.Series(function(categories), dtype=object))
+
+    # Missing rows have code -1, point them at a trailing -1
+    rowCodes = numpy.append(newCodes, -1)[codes]
+    return pandas.Series(pandas.Categorical.from_codes(rowCodes, uniques), index=column.index, name=column.name)
+
+
+def numeric_categories(column):
+    """Turns the categories of a categorical column into numbers when they all are numbers
+
+    `read_csv` always reads categories as text, this gives columns like Raceway Ref. Number
+    the numbers pandas would have inferred without a declared type.
+
+    Args:
+        column (`pandas.Series`): Categorical column
+
+    Returns:
+        `pandas.Series`: The column, with numeric categories where possible
+    """
+    import numpy
+    import pandas
+
+    categories = column.cat.categories
+    if len(categories) == 0 or categories.dtype != object:
+        return column
+    numbers = pandas.to_numeric(categories, errors="coerce")
+    if numpy.isnan(numbers).any() or not numbers.is_unique:
+        return column
+    return column.cat.rename_categories(numbers)
+
+
+def widen_floats(column):
+    """Converts a float32 column to float64 using the shortest decimal of each value
+
+    A plain cast turns 333.3 (stored as float32) into 333.29998779296875, going through
+    the text of the distinct values keeps 333.3 in the workbook.
 
     Args:
-        input (str): The Input string
+        column (`pandas.Series`): float32 column
 
     Returns:
-        str: The filtered string
+        `pandas.Series`: float64 column
     """
-    controlCharsRegex = "/[\u0000-\u001F\u007F-\u009F]/g"
-    return input.replace(controlCharsRegex, '')
+    import numpy
+    import pandas
+
+    codes, uniques = pandas.factorize(column)
+    widened = numpy.append(pandas.to_numeric(pandas.Series(uniques).astype(str)).to_numpy(dtype="float64"), numpy.nan)
+    return pandas.Series(widened[codes], index=column.index, name=column.name)
+
 
+def column_widths(frame, sample=10000):
+    """Length of the longest value in each column, as text, header included
 
-def merge_columns(columns):
+    Categorical columns are measured through their categories, other columns through
+    `sample` evenly spaced rows, so a million row table costs the same as a small one.
+
+    Args:
+        frame (`pandas.DataFrame`): Table to measure
+        sample (int, optional): Rows measured per column. Defaults to 10000.
+
+    Returns:
+        int[]: Characters per column
     """
-    Merge two columns represented as `pandas.Series` objects into one
+    import pandas
+
+    step = max(1, len(frame) // sample)
+    widths = []
+    for header in frame.columns:
+        column = frame[header]
+        if isinstance(column.dtype, pandas.CategoricalDtype):
+            values = pandas.Series(column.cat.categories)
+        else:
+            values = column.iloc[::step].dropna()
+        longest = values.astype(str).str.len().max() if len(values) else 0
+        widths.append(max(int(longest), len(str(header))))
+    return widths
+
+
+def clean_header_names(headers):
+    """Cleans a whole header row in one go
+
+    Removes control characters (including line breaks), the Navisworks category prefixes
+    (Element, Item, Custom, KGE_) and surrounding spaces. Headers that end up with the same
+    name are numbered ("Length", "Length 2", ...) so every column can still be addressed by name.
+
+    Args:
+        headers (str[]): Raw headers
+
+    Returns:
+        str[]: Cleaned headers
+    """
+    headers = removeControlCharacters([str(header).replace("\\r\\n", "") for header in headers])
+
+    cleaned = []
+    seen = set()
+    counts = {}
+    for header in headers:
+        header = headerPrefixRegex.sub("", header).strip()
+        name = header
+        count = counts.get(header, 1)
+        # A numbered name can already be taken, e.g. by a "Custom Length 2" column
+        while name in seen:
+            count += 1
+            name = f"{header} {count}"
+        counts[header] = count
+        seen.add(name)
+        cleaned.append(name)
+    return cleaned
+
+
+def sanitise_columns(frame, columns):
+    """Removes control characters from the text columns of a `pandas.DataFrame` in place
+
+    Args:
+        frame (`pandas.DataFrame`): Table to clean
+        columns (str[]): Columns to clean, non text columns are skipped
+    """
+    import pandas
+
+    for column in columns:
+        if column in frame.columns and (frame[column].dtype == object or isinstance(frame[column].dtype, pandas.CategoricalDtype)):
+            frame[column] = removeControlCharacters(frame[column])
+
+
+def to_numbers(column, suffix=None):
+    """Converts a column to a float array, anything that isn't a number becomes NaN
+
+    Text columns only hold a handful of distinct values ("1200 mm", "600 mm", ...), so
+    only the distinct values are parsed and the results are broadcast back to the rows.
+
+    Args:
+        column (`pandas.Series`): Column to convert
+        suffix (str, optional): Unit suffix to strip first, e.g. " mm". Defaults to None.
+
+    Returns:
+        `numpy.ndarray`: float64 values
+    """
+    import numpy
+    import pandas
+
+    if pandas.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype="float64", na_value=numpy.nan)
+
+    codes, uniques = pandas.factorize(column)
+    uniques = pandas.Series(uniques, dtype=object).astype(str)
+    if suffix:
+        uniques = uniques.str.replace(suffix, "", regex=False)
+    parsed = pandas.to_numeric(uniques, errors="coerce").to_numpy(dtype="float64", na_value=numpy.nan)
+
+    # Missing values have code -1, point them at a trailing NaN
+    parsed = numpy.append(parsed, numpy.nan)
+    return parsed[codes]
+
+
+def merge_columns(columns, suffix=" mm", threshold=1, index=None):
+    """
+    Merge repeated columns (Length, length, Length 2, ...) represented as `pandas.Series` objects into one
+
+    Each row takes the value of the last column (in the given order) that holds a number above `threshold`,
+    rows with no such value are NaN. All columns are merged in a single NumPy operation.
+    The column merged into isn't one of them, see `engine.merge_lengths` for how the Unistrut Length is kept.
 
     Args:
         `pandas.Series[]`: Array of columns
+        suffix (str, optional): Unit suffix to strip before converting to numbers. Defaults to " mm".
+        threshold (int, optional): Values at or below this are ignored. Defaults to 1.
+        index (`pandas.Index`, optional): Index of the result, needed when there are no columns. Defaults to the index of the columns.
 
     Returns:
-        `pandas.Series`: Merged column of data
+        `pandas.Series`: Merged column of data, all NaN when there are no columns
     """
+    import numpy
+    import pandas
 
-    mergedColumn = pandas.Series([])
-    
-    for col in columns:
-        pandas.merge_ordered(mergedColumn, col)
-    
-    return mergedColumn
+    if not columns:
+        return pandas.Series(numpy.nan, index=index if index is not None else pandas.RangeIndex(0), dtype="float64")
+
+    index = columns[0].index
+    values = numpy.column_stack([to_numbers(col, suffix) for col in columns])
+    valid = values > threshold
+
+    # Index of the last valid column in each row
+    last = values.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+    picked = values[numpy.arange(values.shape[0]), last]
+    merged = numpy.where(valid.any(axis=1), picked, numpy.nan)
+
+    return pandas.Series(merged, index=index)
+
+
+def _trie_pattern(keys):
+    """Builds a regex matching any of the keys from a prefix tree of the keys
+
+    A flat `a|b|c` alternation tries every key at every position, the prefix tree only
+    follows the keys sharing the characters read so far, so thousands of keys stay fast.
+    Longer keys are preferred over their prefixes (`M12` over `M1`).
+
+    Args:
+        keys (str[]): Literal strings to match
+
+    Returns:
+        str: Regex pattern
+    """
+    trie = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        terminal = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if terminal:
+            # Greedy optional so the longest key wins
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+
+    return build(trie)
+
+
+def name_table_pattern(items, strip_numbers=True):
+    """Builds the regex source for a name table, matching any key or a trailing " <number>"
+
+    Args:
+        items (tuple): (key, value) pairs of the name table
+        strip_numbers (bool, optional): Also match a trailing " <number>". Defaults to True.
+
+    Returns:
+        str: Regex pattern with a `key` and a `number` group, `None` when there is nothing to match
+    """
+    keys = [key for key, value in items if key]
+    alternatives = []
+    if keys:
+        alternatives.append(f"(?P<key>{_trie_pattern(keys)})")
+    if strip_numbers:
+        alternatives.append(r"(?P<number> \d+$)")
+    return '|'.join(alternatives) or None
+
+
+# Patterns built ahead of time (e.g. saved next to the rules by mappings.MappingStore)
+_prebuiltPatterns = {}
+
+
+def register_name_table(items, pattern):
+    """Registers a prebuilt `name_table_pattern` so it isn't rebuilt on first use
+
+    Args:
+        items (tuple): (key, value) pairs of the name table
+        pattern (str): Result of `name_table_pattern(items)`
+    """
+    _prebuiltPatterns.clear()
+    _prebuiltPatterns[items] = pattern
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_name_table(items, strip_numbers=True):
+    """Compiles a name table into one regex
+
+    Args:
+        items (tuple): (key, value) pairs of the name table
+        strip_numbers (bool, optional): Passed to `name_table_pattern`. Defaults to True.
+
+    Returns:
+        `re.Pattern`: Compiled `name_table_pattern`, `None` when there is nothing to match
+    """
+    pattern = _prebuiltPatterns.get(items) if strip_numbers else None
+    if pattern is None:
+        pattern = name_table_pattern(items, strip_numbers)
+    return None if pattern is None else re.compile(pattern)
+
+
+def updateNamesFromTable(col, table, strip_numbers=True):
+    """Rewrites part codes in a Name column using the name conversion table
+
+    Every key in the table is replaced with its value wherever it occurs, and a trailing
+    " <number>" is removed (Casework 2 -> Casework, MIDAS_Plate_2 is left alone).
+    Both happen in a single regex pass over the column, replaced text isn't scanned again.
+
+    Args:
+        col (`pandas.Series`): Name column
+        table (dict): Name conversions, as returned by `DictionaryFrame.get_data()`
+        strip_numbers (bool, optional): Remove the trailing " <number>", `False` for names that were
+            already normalised (Strut Channel 41 must stay Strut Channel 41). Defaults to True.
+
+    Returns:
+        `pandas.Series`: Updated names
+    """
+    items = tuple((str(key), str(value)) for key, value in table.items())
+    pattern = _compile_name_table(items, strip_numbers)
+    col = col.fillna("").astype(str)
+    if pattern is None:
+        return col
+    replacements = dict(items)
+
+    def replace(match):
+        if match.lastgroup == 'key':
+            return replacements[match.group('key')]
+        return ''
+
+    return col.str.replace(pattern, replace, regex=True)
+
+
+class NameCache:
+    """Remembers cleaned names so each distinct Name is only rewritten once
+
+    Exports have hundreds of thousands of rows but only a few thousand distinct names,
+    so the column is factorized and only names not seen before go through
+    `updateNamesFromTable`. The cache is cleared automatically when the name table or
+    `strip_numbers` changes.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.table = None
+        self.names = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.names = {}
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, col, table, strip_numbers=True):
+        """Same as `updateNamesFromTable`, but only for names that aren't cached yet
+
+        Args:
+            col (`pandas.Series`): Name column
+            table (dict): Name conversions, as returned by `DictionaryFrame.get_data()`
+            strip_numbers (bool, optional): Passed to `updateNamesFromTable`. Defaults to True.
+
+        Returns:
+            `pandas.Series`: Updated names
+        """
+        import numpy
+        import pandas
+
+        items = (tuple((str(key), str(value)) for key, value in table.items()), strip_numbers)
+        if items != self.table:
+            self.clear()
+            self.table = items
+
+        if isinstance(col.dtype, pandas.CategoricalDtype):
+            # Only the categories need rewriting, the rows keep their codes
+            return map_categories(col, lambda names: self._lookup([str(name) for name in names], table, strip_numbers), missing="")
+
+        codes, uniques = pandas.factorize(col.fillna("").astype(str))
+        cleaned = numpy.array(self._lookup(list(uniques), table, strip_numbers), dtype=object)
+        return pandas.Series(cleaned.take(codes), index=col.index, name=col.name)
+
+    def _lookup(self, uniques, table, strip_numbers=True):
+        """Cleaned name of each distinct name, rewriting the ones not cached yet"""
+        missing = [name for name in uniques if name not in self.names]
+        self.misses += len(missing)
+        self.hits += len(uniques) - len(missing)
+
+        if len(self.names) + len(missing) > self.maxsize:
+            # Start over rather than tracking recency, only this column's names are kept
+            self.names = {}
+            missing = list(uniques)
 
+        if missing:
+            import pandas
+            updated = updateNamesFromTable(pandas.Series(missing, dtype=object), table, strip_numbers)
+            self.names.update(zip(missing, updated))
 
-def updateNamesFromTable(col, table):
-    pass
\ No newline at end of file
+        return [self.names[name] for name in uniques]
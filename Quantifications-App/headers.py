@@ -0,0 +1,179 @@
+import functions as fns  # Abstracted Functionality
+
+# Header Index
+# ============
+#
+# The Office Script finds every column with `headerValues.findIndex(header.toLowerCase().includes(...))`
+# and searches again after deleting columns. The header index cleans and lowercases the header row
+# once, classifies every column and answers lookups from dicts, so the pipeline stages never scan
+# the headers themselves. It is built from the header row alone, so a missing required column is
+# reported before any rows are read.
+
+# Navisworks CSV Export Legend, see 0-9-5_Pricing_Pack_Quantification.osts
+LEGEND = ["ID", "GUID", "Category", "Location", "Name", "Size", "Rod Length", "Length", "Unistrut Length",
+          "Angle", "Service type", "Raceway Name", "Raceway Ref. Number"]
+
+# Keywords of the columns the quantification can't run without
+REQUIRED_KEYWORDS = ("name", "unistrut", "angle")
+
+# Column roles
+REQUIRED = "required"
+LEGEND_COLUMN = "legend"
+LENGTH_VARIANT = "length variant"  # Merged into Unistrut Length, then removed
+ANGLE_VARIANT = "angle variant"  # Merged into Angle, then removed
+DROP = "drop"  # Not used by the pricing pack
+
+_legendKeys = {column.lower() for column in LEGEND}
+
+
+class MissingColumnsError(ValueError):
+    """Raised when an export lacks a required column, lists what was found instead"""
+
+    def __init__(self, missing, headers):
+        self.missing = missing
+        self.headers = headers
+        super().__init__(f"Required columns not found: {', '.join(missing)}. Columns in the export: {', '.join(headers) or 'none'}")
+
+    def __reduce__(self):
+        # Rebuilt from both arguments when it comes back from a worker process
+        return type(self), (self.missing, self.headers)
+
+
+class HeaderIndex:
+    """Cleaned headers of an export, with their roles and O(1) lookups
+
+    Args:
+        headers (str[]): Header row of the export
+        clean (bool, optional): Clean the headers first, `False` when they already are. Defaults to True.
+        cleaned (str[], optional): Cleaned headers worked out already, e.g. by `project`. Defaults to None.
+    """
+
+    def __init__(self, headers, clean=True, cleaned=None):
+        self.raw = [str(header) for header in headers]
+        if cleaned is not None:
+            self.headers = list(cleaned)
+        else:
+            self.headers = fns.clean_header_names(self.raw) if clean else list(self.raw)
+        self.lowered = [header.lower() for header in self.headers]
+        self.positions = {header: position for position, header in enumerate(self.headers)}
+        self._found = {}
+
+        self.required = {keyword: self.find(keyword) for keyword in REQUIRED_KEYWORDS}
+        unistrut = self.required["unistrut"]
+        angle = self.required["angle"]
+
+        self.lengths = [header for header, lowered in zip(self.headers, self.lowered)
+                        if "length" in lowered and "rod" not in lowered and header != unistrut]
+        self.angles = [header for header, lowered in zip(self.headers, self.lowered) if "angle" in lowered and header != angle]
+
+        self.roles = {}
+        requiredHeaders = set(self.required.values())
+        lengths = set(self.lengths)
+        angles = set(self.angles)
+        for header, lowered in zip(self.headers, self.lowered):
+            if header in requiredHeaders:
+                self.roles[header] = REQUIRED
+            elif header in lengths:
+                self.roles[header] = LENGTH_VARIANT
+            elif header in angles:
+                self.roles[header] = ANGLE_VARIANT
+            elif lowered in _legendKeys:
+                self.roles[header] = LEGEND_COLUMN
+            else:
+                self.roles[header] = DROP
+
+    @classmethod
+    def from_csv(cls, fileName):
+        """Builds the index from the header row of a csv, without reading any rows
+
+        Args:
+            fileName (str): Name of csv file
+
+        Returns:
+            `HeaderIndex`: Index of the export's headers
+        """
+        return cls(fns.read_csv_header(fileName))
+
+    def find(self, keyword):
+        """Finds the header matching a keyword, preferring an exact match over a partial one
+
+        Args:
+            keyword (str): Lowercase keyword, e.g. `name`
+
+        Returns:
+            str: Matching header, or `None` if no header contains the keyword
+        """
+        if keyword not in self._found:
+            partial = None
+            for header, lowered in zip(self.headers, self.lowered):
+                if lowered == keyword:
+                    partial = header
+                    break
+                if partial is None and keyword in lowered:
+                    partial = header
+            self._found[keyword] = partial
+        return self._found[keyword]
+
+    def position(self, header):
+        """Column number of a cleaned header"""
+        return self.positions[header]
+
+    def raw_header(self, header):
+        """Header as it is in the csv for a cleaned header"""
+        return self.raw[self.positions[header]]
+
+    def columns(self, role):
+        """Headers with a role, in column order
+
+        Args:
+            role (str): One of `REQUIRED`, `LEGEND_COLUMN`, `LENGTH_VARIANT`, `ANGLE_VARIANT` or `DROP`
+
+        Returns:
+            str[]: Matching headers
+        """
+        return [header for header in self.headers if self.roles[header] == role]
+
+    @property
+    def missing(self):
+        """Keywords of the required columns that weren't found"""
+        return [keyword for keyword, header in self.required.items() if header is None]
+
+    def check(self):
+        """Makes sure every required column is there
+
+        Raises:
+            MissingColumnsError: If any required column is missing
+
+        Returns:
+            tuple: (name, unistrut, angle) headers
+        """
+        if self.missing:
+            raise MissingColumnsError(self.missing, self.headers)
+        return self.required["name"], self.required["unistrut"], self.required["angle"]
+
+    @property
+    def selected(self):
+        """Headers the pricing pack uses: required and legend columns and their variants"""
+        return [header for header in self.headers if self.roles[header] != DROP]
+
+    def project(self):
+        """Index of only the `selected` columns, for a frame read with them as `usecols`
+
+        Returns:
+            `HeaderIndex`: Index keeping the cleaned names of this one
+        """
+        selected = self.selected
+        return HeaderIndex([self.raw_header(header) for header in selected], cleaned=selected)
+
+    @property
+    def merged(self):
+        """Variant columns merged into Unistrut Length and Angle, removed from the output"""
+        return [*self.lengths, *self.angles]
+
+    def describe(self):
+        """Headers grouped by role, for logging
+
+        Returns:
+            dict: role -> headers
+        """
+        return {role: self.columns(role) for role in (REQUIRED, LEGEND_COLUMN, LENGTH_VARIANT, ANGLE_VARIANT, DROP)}
@@ -0,0 +1,294 @@
+import contextvars
+import datetime
+import json
+import os
+import sys
+import time
+
+# Instrumentation
+# ===============
+#
+# Pipeline stages are wrapped in `with instrumentation.stage("merge", rows):`. Outside of a
+# recorded run that returns a shared do-nothing context manager, so the hooks cost a
+# contextvar lookup when instrumentation is off. Inside `with instrumentation.Run(name):`
+# every stage adds its time, rows and the peak memory so far to the run. Finished runs are
+# appended to a JSON lines run log and summarised with `functions.log`.
+#
+# This module doesn't import pandas or the other modules at load time, so `functions` can
+# import it.
+
+# Recorded runs for jobs started from the App, see `jobs.JobRunner`
+enabled = False
+
+# Extra capture for recorded runs: None, "cProfile" (call timings) or "tracemalloc" (allocations)
+PROFILERS = (None, "cProfile", "tracemalloc")
+profiler = None
+
+# Run log of recorded App runs, `default_path()` when None
+log_file = None
+
+# Lines of profile / allocation statistics kept in the run log
+PROFILE_LINES = 15
+
+_active = contextvars.ContextVar("instrumentation_run", default=None)
+
+
+def default_path():
+    """Path of the run log in the user's log folder"""
+    import platformdirs
+    return os.path.join(platformdirs.user_log_dir("Quantifications-App", "Kirby Group Engineering"), "runs.jsonl")
+
+
+def run_log_path():
+    """`log_file`, or the default run log, `None` when there's nowhere to write it"""
+    if log_file is not None:
+        return log_file
+    try:
+        return default_path()
+    except ImportError:
+        return None
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes, `None` where it can't be read"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _NullStage:
+    """Stands in for `Stage` when no run is recorded"""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        return False
+
+
+_nullStage = _NullStage()
+
+
+class Stage:
+    """Times one stage of a run, `rows` can be set inside the `with` block once it is known"""
+
+    def __init__(self, run, name, rows=None):
+        self.run = run
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        if self.run.tracing:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        seconds = time.perf_counter() - self.start
+        traced = None
+        if self.run.tracing:
+            import tracemalloc
+            traced = tracemalloc.get_traced_memory()[1]
+        self.run.add(self.name, seconds, self.rows, traced)
+        return False
+
+
+def stage(name, rows=None):
+    """Times a stage of the current run
+
+    Args:
+        name (str): Stage name, stages with the same name (e.g. one per chunk) are added up
+        rows (int, optional): Rows handled by the stage. Defaults to None.
+
+    Returns:
+        `Stage`: Context manager, does nothing when no run is recorded
+    """
+    run = _active.get()
+    if run is None:
+        return _nullStage
+    return Stage(run, name, rows)
+
+
+def active():
+    """The run being recorded in this thread, or `None`"""
+    return _active.get()
+
+
+class Run:
+    """Records the stages of one run
+
+    Args:
+        name (str): Shown in the log, e.g. the App mode
+        profiler (str, optional): One of `PROFILERS`. Defaults to None.
+        path (str, optional): JSON lines run log the summary is appended to, not written when `None`. Defaults to None.
+    """
+
+    def __init__(self, name, profiler=None, path=None):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {profiler}")
+        self.name = name
+        self.profiler = profiler
+        self.path = path
+        self.stages = {}
+        self.status = None
+        self.seconds = None
+        self.profile = None
+        self._profile = None
+        self._token = None
+
+    @property
+    def tracing(self):
+        return self.profiler == "tracemalloc"
+
+    def add(self, name, seconds, rows=None, traced=None):
+        """Adds a timed stage to the run"""
+        record = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rows": None})
+        record["seconds"] += seconds
+        record["calls"] += 1
+        if rows is not None:
+            record["rows"] = (record["rows"] or 0) + rows
+        record["peak_rss"] = peak_rss()
+        if traced is not None:
+            record["traced_peak"] = max(record.get("traced_peak", 0), traced)
+
+    def __enter__(self):
+        self._token = _active.set(self)
+        if self.profiler == "cProfile":
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.tracing:
+            import tracemalloc
+            tracemalloc.start()
+        self.started = datetime.datetime.now()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.seconds = time.perf_counter() - self._start
+        _active.reset(self._token)
+
+        import jobs
+        if kind is None:
+            self.status = "finished"
+        else:
+            self.status = "cancelled" if issubclass(kind, jobs.JobCancelled) else "failed"
+
+        if self._profile is not None:
+            self._profile.disable()
+            self.profile = self._profile_lines()
+        elif self.tracing:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.profile = [str(line) for line in snapshot.statistics("lineno")[:PROFILE_LINES]]
+
+        import functions as fns
+        fns.log(f"{self.name}: {self.describe(', ')}", 'message')
+        if self.path is not None:
+            try:
+                self.write(self.path)
+            except OSError as e:
+                fns.log(f"Could not write the run log: {e}", 'warning')
+        return False
+
+    def _profile_lines(self):
+        import io
+        import pstats
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        return [line for line in stream.getvalue().splitlines() if line.strip()]
+
+    @property
+    def rows(self):
+        """Most rows handled by any stage, i.e. the rows of the export"""
+        counts = [record["rows"] for record in self.stages.values() if record["rows"] is not None]
+        return max(counts) if counts else None
+
+    def summary(self):
+        """Machine readable record of the run, one line of the run log
+
+        Returns:
+            dict: name, status, timings, rows/sec, peak memory and profile lines
+        """
+        stages = {}
+        for name, record in self.stages.items():
+            stages[name] = dict(record)
+            if record["rows"] and record["seconds"]:
+                stages[name]["rows_per_second"] = record["rows"] / record["seconds"]
+
+        rows = self.rows
+        return {
+            "name": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "status": self.status,
+            "seconds": self.seconds,
+            "rows": rows,
+            "rows_per_second": rows / self.seconds if rows and self.seconds else None,
+            "peak_rss": peak_rss(),
+            "stages": stages,
+            "profiler": self.profiler,
+            "profile": self.profile,
+        }
+
+    def describe(self, separator="\n"):
+        """Readable summary, e.g. for the App's run summary panel
+
+        Args:
+            separator (str, optional): Between stages. Defaults to a new line.
+
+        Returns:
+            str: One part per stage and a total
+        """
+        parts = []
+        for name, record in self.stages.items():
+            part = f"{name} {record['seconds']:.2f}s"
+            if record["rows"] and record["seconds"]:
+                part += f" ({record['rows'] / record['seconds']:,.0f} rows/s)"
+            parts.append(part)
+
+        total = f"total {self.seconds:.2f}s" if self.seconds is not None else "running"
+        if self.rows:
+            total += f", {self.rows:,} rows"
+        peak = peak_rss()
+        if peak:
+            total += f", peak memory {peak / 1e6:,.0f} MB"
+        parts.append(total)
+        return separator.join(parts)
+
+    def write(self, path):
+        """Appends the run summary to a JSON lines run log
+
+        Args:
+            path (str): Run log file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(self.summary()) + "\n")
+
+
+def read_log(path=None):
+    """Reads the run log written by recorded runs
+
+    Args:
+        path (str, optional): Run log file. Defaults to `run_log_path()`.
+
+    Returns:
+        dict[]: Run summaries, oldest first
+    """
+    path = path or run_log_path()
+    if path is None or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
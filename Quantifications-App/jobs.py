@@ -0,0 +1,168 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import functions as fns  # Abstracted Functionality
+import instrumentation as ins
+
+# Job Runner
+# ==========
+#
+# Jobs are queued on the App's asyncio loop and run one at a time in a worker thread,
+# so the loop (and the Tk mainloop) never wait on pandas. Tk widgets must only be touched
+# from the main thread, so the runner never calls into Tk: it records progress and posts
+# events, and the App drains them with `self.after` polling (see `App.poll_jobs`).
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled"""
+
+
+class Job:
+    """A queued piece of work, `function(*args, progress=job.report, **kwargs)`"""
+
+    def __init__(self, name, function, args=(), kwargs=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.progress = 0.0
+        self.record = None  # `instrumentation.Run` when runs are recorded
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Asks the job to stop, it stops the next time it reports progress below 1"""
+        self._cancelled.set()
+
+    def call(self):
+        """Runs the job in the calling thread, recording its stages when `instrumentation.enabled`"""
+        if not ins.enabled:
+            return self.function(*self.args, progress=self.report, **self.kwargs)
+
+        with ins.Run(self.name, ins.profiler, ins.run_log_path()) as record:
+            self.record = record
+            return self.function(*self.args, progress=self.report, **self.kwargs)
+
+    def report(self, amount):
+        """Progress callback handed to the job
+
+        Jobs report 1 once their output is written, a cancel that arrives after that is ignored so
+        a run that produced its workbook isn't reported as cancelled.
+
+        Args:
+            amount (float): number between 0 - 1, `None` to only check for cancellation
+
+        Raises:
+            JobCancelled: If the job has been cancelled and hasn't finished its output
+        """
+        if amount is not None and amount >= 1.0:
+            self._cancelled.clear()
+        elif self._cancelled.is_set():
+            raise JobCancelled(self.name)
+        if amount is not None:
+            self.progress = amount
+
+
+class JobRunner:
+    """Runs jobs one after another off the asyncio loop thread"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.events = queue.SimpleQueue()
+        self.current = None
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job")
+
+    @property
+    def busy(self):
+        """True while a job is running or waiting to run"""
+        return self.pending > 0
+
+    def start(self):
+        """Starts the worker coroutine, the loop can be started before or after"""
+        asyncio.run_coroutine_threadsafe(self._worker(), self.loop)
+
+    def submit(self, name, function, *args, **kwargs):
+        """Queues a job, can be called from any thread
+
+        Args:
+            name (str): Shown in the log and events
+            function (callable): Called as `function(*args, progress=job.report, **kwargs)`
+
+        Returns:
+            `Job`: The queued job
+        """
+        job = Job(name, function, args, kwargs)
+        with self._lock:
+            self.pending += 1
+        self.loop.call_soon_threadsafe(self._enqueue, job)
+        return job
+
+    def cancel(self):
+        """Cancels the running job"""
+        if self.current is not None:
+            self.current.cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def poll(self):
+        """Returns the events posted since the last call, for the Tk thread
+
+        Returns:
+            tuple[]: (`"started" | "finished" | "failed" | "cancelled"`, `Job`, result or error)
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _enqueue(self, job):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._queue.put_nowait(job)
+
+    async def _worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+
+        while True:
+            job = await self._queue.get()
+            self.current = job
+            try:
+                await self._run(job)
+            finally:
+                self.current = None
+                with self._lock:
+                    self.pending -= 1
+
+    async def _run(self, job):
+        if job.cancelled:
+            self.events.put(("cancelled", job, None))
+            return
+
+        fns.log(f"Starting job: {job.name}")
+        self.events.put(("started", job, None))
+        start = time.perf_counter()
+        try:
+            result = await self.loop.run_in_executor(self._executor, job.call)
+        except JobCancelled:
+            fns.log(f"Cancelled job: {job.name}", 'warning')
+            self.events.put(("cancelled", job, None))
+        except Exception as e:
+            fns.log(f"{job.name}: {e}", 'error')
+            self.events.put(("failed", job, e))
+        else:
+            fns.log(f"Finished job: {job.name} in {time.perf_counter() - start:.2f}s", 'message')
+            self.events.put(("finished", job, result))
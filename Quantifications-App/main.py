@@ -1,10 +1,20 @@
 import customtkinter as ctk
 from tkinter import filedialog
+import os
 import time
 import asyncio
+import functools
 import threading
+import queue
 import dictionaryFrame as df
+import batch
 import functions as fns  # Abstracted Functionality
+import engine
+import jobs as jb
+import mappings as mp
+import cache as rc
+import instrumentation as ins
+import diff
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
@@ -34,11 +44,50 @@ class App(ctk.CTk):
         
         # Settings variables
         self.num_rows_settings = 10
+
+        # Cleaned names are reused between runs, cleared when the name table changes
+        self.name_cache = fns.NameCache()
+
+        # Name conversion rules saved between sessions
+        self.mappings = mp.MappingStore()
+
+        # Quantified tables of previous runs, keyed by input file + name table
+        self.result_cache = rc.ResultCache()
+
+        # Settings tab label -> engine pivot mode
+        self.pivot_options = {
+            "Static Summary": "static",
+            "Live Summary (Formulas)": "live",
+            "None": None,
+        }
+
+        # Settings tab label -> instrumentation profiler
+        self.profiler_options = {
+            "Off": None,
+            "cProfile (Call Timings)": "cProfile",
+            "tracemalloc (Allocations)": "tracemalloc",
+        }
+
+        # Settings tab label -> engine units mode
+        self.units_options = {
+            "Values": "values",
+            "Formula (=IF(<Unistrut Length>>1,...))": "formula",
+        }
+
+        # Settings tab label -> engine sheet mode, an Excel table needs far more memory to write
+        self.sheet_options = {
+            "Excel Table": "table",
+            "Autofilter (Less Memory)": "filter",
+        }
         
         
          # Create asyncio event loop
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
+
+        # Runs are queued and run one at a time off the event loop, see jobs.py
+        self.jobs = jb.JobRunner(self.loop)
+        self.jobs.start()
         
 
             
@@ -70,7 +119,11 @@ class App(ctk.CTk):
         
         # row 9
         
-        self.modeComboBox = ctk.CTkComboBox(self.mainTab, values=["Generate Quantifications Excel File from CSV"])
+        self.modeComboBox = ctk.CTkComboBox(self.mainTab, values=["Generate Quantifications Excel File from CSV",
+                                                                  "Preview and Generate Quantifications Excel File from CSV",
+                                                                  "Generate Quantifications Excel Files from Folder of CSVs",
+                                                                  "Merge Folder of CSVs into one Quantifications Excel File",
+                                                                  "Update Quantifications from Previous Revision"])
         self.modeComboBox.grid(row=9, column=0, padx=10, pady=0, sticky="ew")
 
         # row 10
@@ -86,6 +139,40 @@ class App(ctk.CTk):
         self.progressBar.grid(row=11, column=0, padx=10, pady=10, sticky="ew")
         self.progressBar.set(0.0)
 
+        # row 12
+
+        # Cancel Button
+        self.cancelButton = ctk.CTkButton(self.mainTab, text="Cancel", command=self.cancel_tool_callback, fg_color="#EE0000", hover_color="#660000", state="disabled")
+        self.cancelButton.grid(row=12, column=0, padx=10, pady=10, sticky="ew")
+
+        # row 13 - 14
+
+        # Stage timings of the last recorded run
+        self.summaryFrame = ctk.CTkFrame(self.mainTab)
+        self.summaryFrame.grid(row=13, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.summaryLabel = ctk.CTkLabel(self.summaryFrame, text="Run Summary")
+        self.summaryLabel.pack(padx=10, pady=0)
+
+        self.summaryTextbox = ctk.CTkTextbox(self.mainTab, height=140)
+        self.summaryTextbox.grid(row=14, column=0, padx=10, pady=(0, 10), sticky="ew")
+        self.show_run_summary("Turn on \"Record run timings\" in Settings to see where each run spends its time.")
+
+        # row 15 - 16
+
+        # First cleaned rows of a preview run, posted from the job thread and shown by poll_jobs
+        self.previews = queue.SimpleQueue()
+
+        self.previewFrame = ctk.CTkFrame(self.mainTab)
+        self.previewFrame.grid(row=15, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.previewLabel = ctk.CTkLabel(self.previewFrame, text="Preview")
+        self.previewLabel.pack(padx=10, pady=0)
+
+        self.previewTextbox = ctk.CTkTextbox(self.mainTab, height=240, wrap="none", font=ctk.CTkFont(family="Courier", size=12))
+        self.previewTextbox.grid(row=16, column=0, padx=10, pady=(0, 10), sticky="ew")
+        self.show_preview_text("Use the \"Preview and Generate\" mode to check the cleaned headers and names while the rest of the export is processed.")
+
+        self.after(100, self.poll_jobs)
+
         
         
         # END Main Menu Tab =================================================================================================
@@ -111,6 +198,12 @@ class App(ctk.CTk):
         self.removeRowButton = ctk.CTkButton(self.settingsTab, text="-", command=self.remove_settings_row_callback, fg_color="#EE0000", hover_color="#660000")
         self.removeRowButton.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
 
+        self.importRulesButton = ctk.CTkButton(self.settingsTab, text="Import Rules", command=self.import_rules_callback)
+        self.importRulesButton.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="ew")
+
+        self.exportRulesButton = ctk.CTkButton(self.settingsTab, text="Export Rules", command=self.export_rules_callback)
+        self.exportRulesButton.grid(row=1, column=1, padx=10, pady=(0, 10), sticky="ew")
+
         # CTkLabel in a CTkFrame
         self.frame = ctk.CTkFrame(self.settingsTab)
         self.frame.grid(row=8, column=0, padx=10, pady=0, sticky="ew")
@@ -122,6 +215,64 @@ class App(ctk.CTk):
         
         self.nameUpdate = df.DictionaryFrame(self.settingsTab, num_rows=self.num_rows_settings)
         self.nameUpdate.grid(row=9, column=0, padx=10, pady=0, sticky="ew")
+
+        # Saved rules are read once the window is up
+        self.after_idle(self.load_name_map)
+
+        # Pivot Table sheet options
+        self.pivotFrame = ctk.CTkFrame(self.settingsTab)
+        self.pivotFrame.grid(row=10, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.pivotLabel = ctk.CTkLabel(self.pivotFrame, text="Pivot Table")
+        self.pivotLabel.pack(padx=10, pady=0)
+
+        self.pivotComboBox = ctk.CTkComboBox(self.settingsTab, values=list(self.pivot_options))
+        self.pivotComboBox.grid(row=11, column=0, padx=10, pady=(0, 10), sticky="ew")
+
+        # Units (mm/No.) column options
+        self.unitsFrame = ctk.CTkFrame(self.settingsTab)
+        self.unitsFrame.grid(row=12, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.unitsLabel = ctk.CTkLabel(self.unitsFrame, text="Units Column")
+        self.unitsLabel.pack(padx=10, pady=0)
+
+        self.unitsComboBox = ctk.CTkComboBox(self.settingsTab, values=list(self.units_options))
+        self.unitsComboBox.grid(row=13, column=0, padx=10, pady=(0, 10), sticky="ew")
+
+        # Quantifications sheet options
+        self.sheetFrame = ctk.CTkFrame(self.settingsTab)
+        self.sheetFrame.grid(row=14, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.sheetLabel = ctk.CTkLabel(self.sheetFrame, text="Quantifications Sheet")
+        self.sheetLabel.pack(padx=10, pady=0)
+
+        self.sheetComboBox = ctk.CTkComboBox(self.settingsTab, values=list(self.sheet_options))
+        self.sheetComboBox.grid(row=15, column=0, padx=10, pady=(0, 10), sticky="ew")
+
+        # Result cache
+        self.cacheFrame = ctk.CTkFrame(self.settingsTab)
+        self.cacheFrame.grid(row=16, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.cacheLabel = ctk.CTkLabel(self.cacheFrame, text="Result Cache")
+        self.cacheLabel.pack(padx=10, pady=0)
+
+        self.cacheCheckBox = ctk.CTkCheckBox(self.settingsTab, text="Reuse results of unchanged exports")
+        self.cacheCheckBox.grid(row=17, column=0, padx=10, pady=(10, 0), sticky="w")
+        self.cacheCheckBox.select()
+
+        self.cacheInfoLabel = ctk.CTkLabel(self.settingsTab, text=self.result_cache.describe())
+        self.cacheInfoLabel.grid(row=18, column=0, padx=10, pady=0, sticky="w")
+
+        self.clearCacheButton = ctk.CTkButton(self.settingsTab, text="Clear Cache", command=self.clear_cache_callback, fg_color="#EE0000", hover_color="#660000")
+        self.clearCacheButton.grid(row=18, column=1, padx=10, pady=10, sticky="ew")
+
+        # Run timings
+        self.instrumentFrame = ctk.CTkFrame(self.settingsTab)
+        self.instrumentFrame.grid(row=19, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.instrumentLabel = ctk.CTkLabel(self.instrumentFrame, text="Run Timings")
+        self.instrumentLabel.pack(padx=10, pady=0)
+
+        self.instrumentCheckBox = ctk.CTkCheckBox(self.settingsTab, text="Record run timings", command=self.instrument_callback)
+        self.instrumentCheckBox.grid(row=20, column=0, padx=10, pady=(10, 0), sticky="w")
+
+        self.profilerComboBox = ctk.CTkComboBox(self.settingsTab, values=list(self.profiler_options), command=self.profiler_callback)
+        self.profilerComboBox.grid(row=21, column=0, padx=10, pady=10, sticky="ew")
         
         
         
@@ -182,22 +333,108 @@ class App(ctk.CTk):
     # Async Callbacks =======================================================================================================
         
     def run_tool_callback(self):
-        asyncio.run_coroutine_threadsafe(self.run_tool_async(), self.loop)
-
-    async def run_tool_async(self):
-        fns.log("Running Tool")
-        await self.update_progress_async(0.5)
-        fns.log("Set value to 0.5", 'message')
-        
-        # Simulate some work
-        await asyncio.sleep(2)
-        
-        await self.update_progress_async(0.0)
-        fns.log("Set value to 0.0", 'message')
-
-
-    async def update_progress_async(self, amount):
-        self.after(0, self.update_progress_callback, amount)
+        if self.jobs.busy:
+            fns.log("A run is already in progress", 'warning')
+            return
+
+        # Tk widgets can only be read from the main thread
+        mode = self.modeComboBox.get()
+
+        previous = None
+        if mode in ("Generate Quantifications Excel File from CSV", "Preview and Generate Quantifications Excel File from CSV",
+                    "Update Quantifications from Previous Revision"):
+            filetypes = [("CSV files", "*.csv")]
+            if mode == "Generate Quantifications Excel File from CSV":
+                # Earlier Quantifications workbooks are quantified again with the current name rules
+                filetypes.append(("Quantifications workbooks", "*.xlsx"))
+            fileName = filedialog.askopenfilename(title="Select Navisworks CSV Export", filetypes=filetypes)
+            if not fileName:
+                return
+            if mode == "Update Quantifications from Previous Revision":
+                # Cancelling processes every row and saves a snapshot for the next revision
+                previous = filedialog.askopenfilename(title="Select Previous Revision Snapshot", filetypes=[("Snapshots", "*" + diff.SNAPSHOT_SUFFIX)]) or None
+            outputName = filedialog.asksaveasfilename(title="Save Quantifications As", defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx")])
+            if not outputName:
+                return
+            outputName = os.path.splitext(outputName)[0]
+        else:
+            fileName = filedialog.askdirectory(title="Select Folder of Navisworks CSV Exports")
+            if not fileName:
+                return
+            outputName = filedialog.askdirectory(title="Select Output Folder")
+            if not outputName:
+                return
+
+        options = {
+            "name_map": self.nameUpdate.get_data(),
+            "pivot": self.pivot_options.get(self.pivotComboBox.get(), "static"),
+            "units": self.units_options.get(self.unitsComboBox.get(), "values"),
+            "sheet": self.sheet_options.get(self.sheetComboBox.get(), "table"),
+            "cache": self.result_cache if self.cacheCheckBox.get() else None,
+        }
+
+        match mode:
+            case "Generate Quantifications Excel File from CSV" if fns.is_workbook(fileName):
+                options.pop("cache")
+                job = functools.partial(engine.quantify_workbook, fileName, outputName, name_cache=self.name_cache, **options)
+            case "Generate Quantifications Excel File from CSV":
+                # Large exports are split across every core
+                job = functools.partial(engine.quantify_csv, fileName, outputName, name_cache=self.name_cache, workers=None, **options)
+            case "Preview and Generate Quantifications Excel File from CSV":
+                # Streamed, the first rows are shown while the rest of the export is processed
+                options.pop("cache")
+                self.show_preview_text(f"Reading the first {engine.PREVIEW_ROWS:,} rows of {os.path.basename(fileName)}...")
+                job = functools.partial(engine.quantify_csv, fileName, outputName, name_cache=self.name_cache,
+                                        preview=lambda frame, roles: self.previews.put((frame, roles)), **options)
+            case "Generate Quantifications Excel Files from Folder of CSVs" | "Merge Folder of CSVs into one Quantifications Excel File":
+                job = functools.partial(batch.quantify_batch, fileName, outputName, merge=mode.startswith("Merge"), **options)
+            case "Update Quantifications from Previous Revision":
+                options.pop("cache")
+                job = functools.partial(diff.quantify_revision, fileName, outputName, previous, name_cache=self.name_cache, **options)
+            case _:
+                fns.log(f"Unknown mode: {mode}", 'error')
+                return
+
+        fns.log(f"Running Tool: {mode}")
+        self.jobs.submit(mode, job)
+        self.update_progress_callback(0.0)
+        self.button.configure(state="disabled")
+        self.cancelButton.configure(state="normal")
+
+    def cancel_tool_callback(self):
+        self.jobs.cancel()
+
+    def poll_jobs(self):
+        """Applies job progress and results to the UI, runs on the Tk thread every 100ms"""
+        for event, job, result in self.jobs.poll():
+            match event:
+                case "finished":
+                    fns.log(f"Saved {result}", 'message')
+                    self.update_progress_callback(1.0)
+                    self.cacheInfoLabel.configure(text=self.result_cache.describe())
+                case "failed" if isinstance(result, batch.BatchError) and result.outputs:
+                    # The other files were still written
+                    fns.log(f"Saved {result.outputs}", 'message')
+                    self.update_progress_callback(1.0)
+                    self.cacheInfoLabel.configure(text=self.result_cache.describe())
+                case "failed" | "cancelled":
+                    self.update_progress_callback(0.0)
+            if event != "started" and job.record is not None:
+                status = f"finished with {batch.describe_failures(result.failures)}" if isinstance(result, batch.BatchError) else job.record.status
+                self.show_run_summary(f"{job.name} ({status})\n{job.record.describe()}")
+
+        while not self.previews.empty():
+            self.show_preview(*self.previews.get_nowait())
+
+        current = self.jobs.current
+        if current is not None:
+            self.update_progress_callback(current.progress)
+
+        if not self.jobs.busy:
+            self.button.configure(state="normal")
+            self.cancelButton.configure(state="disabled")
+
+        self.after(100, self.poll_jobs)
 
     def update_progress_callback(self, amount):
         """Sets progress bar amount
@@ -208,22 +445,80 @@ class App(ctk.CTk):
         self.progressBar.set(amount)
 
 
+    def show_run_summary(self, text):
+        self.summaryTextbox.configure(state="normal")
+        self.summaryTextbox.delete("1.0", "end")
+        self.summaryTextbox.insert("1.0", text)
+        self.summaryTextbox.configure(state="disabled")
+
+    def show_preview_text(self, text):
+        self.previewTextbox.configure(state="normal")
+        self.previewTextbox.delete("1.0", "end")
+        self.previewTextbox.insert("1.0", text)
+        self.previewTextbox.configure(state="disabled")
+
+    def show_preview(self, frame, roles):
+        """Shows the roles of the export's columns and the first quantified rows
+
+        Args:
+            frame (`pandas.DataFrame`): First rows of the Quantifications table
+            roles (dict): role -> headers, see `headers.HeaderIndex.describe`
+        """
+        lines = [f"{role}: {', '.join(headers) or 'none'}" for role, headers in roles.items()]
+        lines.append("")
+        lines.append(frame.to_string(max_colwidth=40, na_rep=""))
+        self.show_preview_text("\n".join(lines))
+
+    def instrument_callback(self):
+        ins.enabled = bool(self.instrumentCheckBox.get())
+
+    def profiler_callback(self, choice):
+        ins.profiler = self.profiler_options.get(choice)
+
     def add_settings_row_callback(self):
-        asyncio.run_coroutine_threadsafe(self.add_settings_row(), self.loop)
-        
-    async def add_settings_row(self):
-        self.num_rows_settings += 1
-        await self.nameUpdate._draw()
-        fns.log(self.num_rows_settings, 'log')
-        
-    def remove_settings_row_callback(self):
-        asyncio.run_coroutine_threadsafe(self.remove_settings_row(), self.loop)
-        
-    async def remove_settings_row(self):
-        self.num_rows_settings -= 1
-        await self.nameUpdate._draw()
-        fns.log(self.num_rows_settings, 'log')
+        self.nameUpdate.append_row()
+        self.num_rows_settings = self.nameUpdate.num_rows
+        fns.log(f"{self.num_rows_settings}", 'log')
 
+    def remove_settings_row_callback(self):
+        self.nameUpdate.remove_row()
+        self.num_rows_settings = self.nameUpdate.num_rows
+        fns.log(f"{self.num_rows_settings}", 'log')
+
+
+
+    def clear_cache_callback(self):
+        if self.jobs.busy:
+            fns.log("Can't clear the cache during a run", 'warning')
+            return
+        self.result_cache.clear()
+        self.cacheInfoLabel.configure(text=self.result_cache.describe())
+
+    def load_name_map(self):
+        rules = self.mappings.rules
+        self.nameUpdate.set_data(engine.DEFAULT_NAME_MAP if rules is None else rules)
+
+    def import_rules_callback(self):
+        fileName = filedialog.askopenfilename(title="Import Name Rules", filetypes=[("Rule files", "*.csv *.xlsx"), ("CSV files", "*.csv"), ("Excel files", "*.xlsx")])
+        if not fileName:
+            return
+        try:
+            rules = mp.import_rules(fileName)
+        except Exception as e:
+            fns.log(f"Could not import {fileName}: {e}", 'error')
+            return
+        self.nameUpdate.set_data(rules)
+        self.num_rows_settings = self.nameUpdate.num_rows
+        self.mappings.save(rules)
+
+    def export_rules_callback(self):
+        fileName = filedialog.asksaveasfilename(title="Export Name Rules", defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx")])
+        if not fileName:
+            return
+        try:
+            mp.export_rules(self.nameUpdate.get_data(), fileName)
+        except Exception as e:
+            fns.log(f"Could not export {fileName}: {e}", 'error')
 
 
     def start_async_loop(self):
@@ -231,6 +526,11 @@ class App(ctk.CTk):
         self.loop.run_forever()
 
     def on_closing(self):
+        try:
+            self.mappings.save(self.nameUpdate.get_data())
+        except OSError as e:
+            fns.log(f"Could not save name map: {e}", 'error')
+        self.jobs.shutdown()
         self.loop.call_soon_threadsafe(self.loop.stop)
         self.destroy()
     
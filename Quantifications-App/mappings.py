@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+
+import functions as fns  # Abstracted Functionality
+
+# Name Mapping Store
+# ==================
+#
+# The name conversion table (Settings tab) is saved to the user's data folder as json,
+# together with the regex `functions.updateNamesFromTable` builds from it, so large
+# tables don't need the pattern rebuilt every launch.
+
+APP_NAME = "Quantifications-App"
+APP_AUTHOR = "Kirby Group Engineering"
+STORE_VERSION = 1
+
+# Saved patterns are only reused when the pattern builder still gives the same regex for these
+# rules, so a change to `functions.name_table_pattern` can't bring back a stale pattern
+PROBE_RULES = (("P1428-H-", "M1116"), ("M12", "M10"), ("M1", "M1 "), ("P1062", "P1020"), ("a.b", "a|b"))
+
+
+def default_path():
+    """Path of the mapping store in the user's data folder"""
+    import platformdirs
+    return os.path.join(platformdirs.user_data_dir(APP_NAME, APP_AUTHOR), "name_map.json")
+
+
+def _items(rules):
+    return tuple((str(key), str(value)) for key, value in rules.items())
+
+
+def _digest(items):
+    """Digest of the rules and of the pattern the builder makes for `PROBE_RULES`"""
+    return hashlib.sha1(json.dumps([items, fns.name_table_pattern(PROBE_RULES)]).encode("utf-8")).hexdigest()
+
+
+class MappingStore:
+    """Loads, saves, imports and exports the name conversion table"""
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self._rules = None
+
+    @property
+    def rules(self):
+        """The rules as a dict, read from disk the first time they're needed"""
+        if self._rules is None:
+            self._rules = self.load()
+        return self._rules
+
+    def load(self):
+        """Reads the rules and registers their saved pattern
+
+        Returns:
+            dict: Rules, or `None` if nothing has been saved yet
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                stored = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            fns.log(f"Could not read name map {self.path}: {e}", 'warning')
+            return None
+
+        items = tuple((key, value) for key, value in stored.get("rules", []))
+        if stored.get("version") == STORE_VERSION and stored.get("digest") == _digest(items) and "pattern" in stored:
+            fns.register_name_table(items, stored["pattern"])
+        return dict(items)
+
+    def save(self, rules):
+        """Writes the rules and their pattern
+
+        Args:
+            rules (dict): Name conversions, as returned by `DictionaryFrame.get_data()`
+        """
+        items = _items(rules)
+        if self._rules is not None and _items(self._rules) == items and os.path.exists(self.path):
+            return
+
+        stored = {
+            "version": STORE_VERSION,
+            "digest": _digest(items),
+            "pattern": fns.name_table_pattern(items),
+            "rules": [list(item) for item in items],
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # Write to a temporary file first so a crash can't leave half a file
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(stored, file, separators=(",", ":"))
+        os.replace(temporary, self.path)
+
+        fns.register_name_table(items, stored["pattern"])
+        self._rules = dict(items)
+
+
+def import_rules(fileName):
+    """Reads rules from the first two columns of a csv or xlsx file (Input, Output)
+
+    Args:
+        fileName (str): csv or xlsx file, a header row is expected
+
+    Returns:
+        dict: Rules in file order, blank inputs skipped
+    """
+    import pandas
+
+    if fileName.lower().endswith((".xlsx", ".xlsm")):
+        # pandas reads xlsx with openpyxl
+        frame = pandas.read_excel(fileName, dtype=str, usecols=[0, 1], engine="openpyxl")
+    else:
+        frame = pandas.read_csv(fileName, dtype=str, usecols=[0, 1])
+
+    frame = frame.fillna("")
+    frame = frame[frame.iloc[:, 0] != ""]
+    rules = dict(zip(frame.iloc[:, 0], frame.iloc[:, 1]))
+    fns.log(f"Imported {len(rules)} name rules from {fileName}", 'message')
+    return rules
+
+
+def export_rules(rules, fileName):
+    """Writes rules to a csv or xlsx file with Input and Output columns
+
+    Args:
+        rules (dict): Name conversions
+        fileName (str): csv or xlsx file
+    """
+    import pandas
+
+    frame = pandas.DataFrame(list(rules.items()), columns=["Input", "Output"])
+    if fileName.lower().endswith(".xlsx"):
+        frame.to_excel(fileName, index=False, engine="xlsxwriter")
+    else:
+        frame.to_csv(fileName, index=False)
+    fns.log(f"Exported {len(rules)} name rules to {fileName}", 'message')
@@ -0,0 +1,265 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy
+import pandas
+from pandas.api.types import union_categoricals
+
+import functions as fns  # Abstracted Functionality
+import engine
+import headers as hd
+import instrumentation as ins
+import batch
+
+# Chunk-Parallel Mode
+# ===================
+#
+# A whole campus export can be millions of rows in one csv, which the batch process pool
+# doesn't help with. The file is split into byte ranges on row boundaries, every range is
+# parsed and quantified in a worker process, and the workers hand their tables back as Arrow
+# IPC files that are memory mapped here, instead of pickling DataFrames through the pool.
+# Ranges are put back together in file order, so the table is the same as a single process run.
+
+# Exports smaller than this are quicker in one process than starting a pool
+PARALLEL_MIN_BYTES = 64 << 20
+
+# More ranges than workers, so a worker that finishes early picks up another
+RANGES_PER_WORKER = 2
+
+# Bytes read at a time when looking for row boundaries
+SCAN_BLOCK_BYTES = 1 << 24
+# Bytes after a target searched at a time for the end of a row
+SCAN_WINDOW_BYTES = 1 << 16
+
+_QUOTE = ord('"')
+_NEWLINE = ord("\n")
+
+
+def worker_count(fileName, workers=None):
+    """Processes worth quantifying an export with
+
+    Args:
+        fileName (str): Name of csv file
+        workers (int, optional): Requested processes, one per core for exports over `PARALLEL_MIN_BYTES` when `None`. Defaults to None.
+
+    Returns:
+        int: Processes, 1 to quantify it in this process
+    """
+    try:
+        import pyarrow  # noqa: F401, the ranges are read and handed back with pyarrow
+    except ImportError:
+        return 1
+    if workers is None:
+        if os.path.getsize(fileName) < PARALLEL_MIN_BYTES:
+            return 1
+        return batch.worker_count(os.cpu_count() or 1)
+    return max(1, workers)
+
+
+def _row_end(data, isQuote, position, quotes):
+    """First row end at or after `position` in a block, `None` when the block ends first
+
+    Args:
+        data (`numpy.ndarray`): Bytes of the block
+        isQuote (`numpy.ndarray`): `data == '"'`
+        position (int): Offset in the block to search from
+        quotes (int): Quotes in the file before the block
+
+    Returns:
+        int: Offset in the block just after the row's line break
+    """
+    parity = (quotes + int(numpy.count_nonzero(isQuote[:position]))) & 1
+    while position < len(data):
+        window = slice(position, position + SCAN_WINDOW_BYTES)
+        # Quote parity up to every byte of the window, a row ends at a line break with even parity
+        inside = numpy.bitwise_xor.accumulate(isQuote[window].view(numpy.uint8)) ^ parity
+        ends = numpy.flatnonzero((data[window] == _NEWLINE) & (inside == 0))
+        if len(ends):
+            return position + int(ends[0]) + 1
+        parity = int(inside[-1])
+        position += SCAN_WINDOW_BYTES
+    return None
+
+
+def row_boundaries(fileName, parts):
+    """Splits a csv into byte ranges that start and end on row boundaries
+
+    Navisworks puts line breaks inside quoted values, so a line break only ends a row when an
+    even number of quotes came before it. Quotes are counted with NumPy a block at a time, the
+    running parity is only worked out in a small window after each target.
+
+    Args:
+        fileName (str): Name of csv file
+        parts (int): Ranges wanted, fewer are returned for small files
+
+    Returns:
+        tuple[]: (start, end) byte offsets of each range, the header row is in none of them
+    """
+    size = os.path.getsize(fileName)
+    boundaries = []
+    targets = None
+    quotes = 0
+    offset = 0
+
+    with open(fileName, "rb") as file:
+        while targets is None or targets:
+            block = file.read(SCAN_BLOCK_BYTES)
+            if not block:
+                break
+            data = numpy.frombuffer(block, dtype=numpy.uint8)
+            isQuote = data == _QUOTE
+
+            if targets is None:
+                end = _row_end(data, isQuote, 0, quotes)
+                if end is not None:
+                    # The first row end closes the header, the rest is split evenly
+                    boundaries.append(offset + end)
+                    step = (size - boundaries[0]) / parts
+                    targets = [boundaries[0] + round(step * part) for part in range(1, parts)]
+
+            # Each target moves on to the first row end at or after it, in a later block if need be
+            while targets and targets[0] < offset + len(data):
+                end = _row_end(data, isQuote, max(targets[0] - offset, 0), quotes)
+                if end is None:
+                    break
+                if offset + end > boundaries[-1]:
+                    boundaries.append(offset + end)
+                targets.pop(0)
+
+            quotes += int(numpy.count_nonzero(isQuote))
+            offset += len(data)
+
+    if boundaries and boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _quantify_range(fileName, start, end, index, name_map, types, inferred, outputPath):
+    """Parses and quantifies one byte range, writes the table to an Arrow IPC file
+
+    Returns:
+        dict: Arrow type each undeclared column was read as, see `quantify_chunks`
+    """
+    import pyarrow
+    from pyarrow import ipc
+
+    with open(fileName, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    selected = index.project()
+    frame, columnTypes = fns.read_csv_columns(pyarrow.BufferReader(data), selected.raw, types, index.raw, inferred,
+                                              header=False, with_types=True)
+    # Numeric categories are worked out on the whole table, see `combine`
+    frame = engine.run_pipeline(frame, name_map, name_cache=batch._worker_cache, index=selected, numbers=False)
+
+    table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    with ipc.new_file(outputPath, table.schema) as writer:
+        writer.write_table(table)
+    return {header: kind for header, kind in columnTypes.items() if header not in types}
+
+
+def _read_table(path):
+    """Reads a worker's Arrow IPC file through a memory map"""
+    import pyarrow
+    from pyarrow import ipc
+
+    with pyarrow.memory_map(path) as source:
+        # to_pandas copies out of the map, so the file can be removed afterwards
+        return ipc.open_file(source).read_all().to_pandas()
+
+
+def combine(frames):
+    """Joins quantified ranges in order, the same table as quantifying the file in one go
+
+    Categorical columns are joined with `union_categoricals`, instead of becoming text when
+    the ranges have different categories.
+
+    Args:
+        frames (`pandas.DataFrame`[]): Tables of the ranges, in file order
+
+    Returns:
+        `pandas.DataFrame`: Quantifications table
+    """
+    columns = {}
+    for header in frames[0].columns:
+        parts = [frame[header] for frame in frames]
+        if all(isinstance(part.dtype, pandas.CategoricalDtype) for part in parts):
+            try:
+                columns[header] = pandas.Series(union_categoricals(parts, ignore_order=True), name=header)
+                continue
+            except TypeError:  # Categories of different types, e.g. an empty range
+                parts = [part.astype(object) for part in parts]
+        columns[header] = pandas.concat(parts, ignore_index=True)
+    return engine.apply_schema(pandas.DataFrame(columns))
+
+
+def quantify_chunks(fileName, index=None, name_map=None, workers=None, progress=None):
+    """Quantifies a large export in parallel worker processes
+
+    Args:
+        fileName (str): Name of csv file
+        index (`headers.HeaderIndex`, optional): Headers of the export, read from the file when `None`. Defaults to None.
+        name_map (dict, optional): Part code replacements. Defaults to `engine.DEFAULT_NAME_MAP`.
+        workers (int, optional): Worker processes, see `worker_count`. Defaults to None.
+        progress (callable, optional): Called with a number between 0 - 1 as each range finishes. Defaults to None.
+
+    Raises:
+        headers.MissingColumnsError: If any required column is missing
+
+    Returns:
+        `pandas.DataFrame`: Quantifications table, the same as `engine.run_pipeline` on the whole export
+    """
+    report = progress or (lambda amount: None)
+    if index is None:
+        index = hd.HeaderIndex.from_csv(fileName)
+    index.check()
+    selected = index.project()
+    workers = worker_count(fileName, workers)
+
+    with ins.stage("split"):
+        ranges = row_boundaries(fileName, workers * RANGES_PER_WORKER)
+        types = engine.export_types(selected)
+    if not ranges:
+        return engine.run_pipeline(engine.read_export(fileName, index), name_map, index=selected)
+
+    fns.log(f"Quantifying {len(ranges)} parts of {fileName} with {workers} workers")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"{part}.arrow") for part in range(len(ranges))]
+        executor = ProcessPoolExecutor(max_workers=max(1, min(workers, len(ranges))), initializer=batch._init_worker)
+
+        def run(parts, inferred):
+            futures = {executor.submit(_quantify_range, fileName, *ranges[part], index, name_map, types, inferred, paths[part]): part
+                       for part in parts}
+            results = {}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                report(len(results) / len(futures))
+            return results
+
+        try:
+            # The workers' stages run in other processes, the run only sees the pool as a whole
+            with ins.stage("workers"):
+                # Undeclared columns are inferred by every worker on its own range
+                inferred = run(range(len(ranges)), None)
+
+                # A column whose type depends on the range (numbers in one, text in another) gets the
+                # type of the whole file, only the ranges that read it as something else are read again
+                mixed = [header for header in selected.raw if header not in types and len({str(kinds.get(header)) for kinds in inferred.values()}) > 1]
+                if mixed:
+                    columnTypes = fns.csv_column_types(fileName, mixed, index.raw)
+                    again = [part for part, kinds in inferred.items()
+                             if any(kinds.get(header) != columnTypes[header] for header in mixed)]
+                    fns.log(f"Reading {len(again)} parts again for the types of {', '.join(mixed)}")
+                    run(again, columnTypes)
+        except BaseException:
+            # Don't wait for queued ranges when cancelled or failing
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+        with ins.stage("combine") as stage:
+            frame = combine([_read_table(path) for path in paths])
+            stage.rows = len(frame)
+    return frame
@@ -0,0 +1,198 @@
+import time
+
+_started = time.perf_counter()
+
+import argparse
+import contextlib
+import os
+import sys
+
+import functions as fns  # Abstracted Functionality
+import headers as hd
+import instrumentation as ins
+
+# Command Line
+# ============
+#
+# Runs the quantification without the App, e.g. from build scripts or scheduled jobs on
+# machines with no display:
+#
+#   python -m quantifications run export.csv -o "Pricing Pack.xlsx"
+#   python -m quantifications run "Rev B.xlsx" --previous "Rev A.xlsx" -o "Rev B Changes.xlsx"
+#   python -m quantifications batch exports/ -o output/ --merge
+#   python -m quantifications check export.csv
+#
+# Nothing here imports Tk. The pipeline modules (pandas, numpy, xlsxwriter) are only
+# imported once a command needs them, so `check` and `--help` start in well under a second.
+# `--timings` reports the start up and import time next to the pipeline stages.
+
+VERSION = "1.0.0"
+
+# Exit codes
+FAILED = 1
+BAD_INPUT = 2
+
+
+def startup_seconds():
+    """Seconds since this module started loading"""
+    return time.perf_counter() - _started
+
+
+def _output_name(path, default):
+    """Output name without the .xlsx extension the pipeline adds"""
+    path = path or default
+    return path[:-len(".xlsx")] if path.lower().endswith(".xlsx") else path
+
+
+def _name_map(args):
+    """Rules from `--rules`, else the rules saved by the App, else the built in table (`None`)"""
+    import mappings as mp
+
+    if args.rules:
+        return mp.import_rules(args.rules)
+    try:
+        return mp.MappingStore().rules
+    except ImportError:  # platformdirs isn't installed, there's no saved table to find
+        return None
+
+
+def _pivot_mode(value):
+    return None if value == "none" else value
+
+
+def _cache(args):
+    if not args.cache:
+        return None
+    import cache as rc
+    return rc.ResultCache()
+
+
+def check_command(args):
+    """Reports the roles of an export's columns, without reading any rows"""
+    index = hd.HeaderIndex.from_csv(args.input)
+    for role, headers in index.describe().items():
+        fns.log(f"{role}: {', '.join(headers) or 'none'}")
+    index.check()
+    fns.log(f"{args.input} has every required column", 'message')
+
+
+def run_command(args):
+    """Quantifies one export, or a revision of it with `--revision` / `--previous`
+
+    A Quantifications workbook of an earlier run is quantified again with the current rules,
+    or compared with the workbook of the previous revision given with `--previous`.
+    """
+    workbook = fns.is_workbook(args.input)
+    if not workbook:
+        # Only the header row, so a missing column fails before pandas is imported
+        hd.HeaderIndex.from_csv(args.input).check()
+    elif args.revision or (args.previous is not None and not fns.is_workbook(args.previous)):
+        raise ValueError("Workbooks are compared with the previous revision's workbook, not a snapshot")
+    outputName = _output_name(args.output, os.path.splitext(args.input)[0])
+    name_map = _name_map(args)
+
+    # pandas, numpy and the pipeline are imported here, timed as their own stage
+    with ins.stage("import"):
+        import engine
+        import diff
+
+    options = {"name_map": name_map, "pivot": _pivot_mode(args.pivot), "units": args.units, "sheet": args.sheet}
+    if workbook:
+        if args.previous is not None:
+            return diff.compare_workbooks(args.previous, args.input, outputName, **options)
+        return engine.quantify_workbook(args.input, outputName, **options)
+    if args.revision or args.previous is not None:
+        return diff.quantify_revision(args.input, outputName, args.previous, **options)
+    return engine.quantify_csv(args.input, outputName, chunksize=args.chunksize, cache=_cache(args), workers=args.workers, **options)
+
+
+def batch_command(args):
+    """Quantifies a folder of exports into one workbook each, or one merged workbook"""
+    name_map = _name_map(args)
+    with ins.stage("import"):
+        import batch
+    return batch.quantify_batch(args.input, args.output, name_map=name_map, merge=args.merge, workers=args.workers,
+                                pivot=_pivot_mode(args.pivot), units=args.units, cache=_cache(args), sheet=args.sheet)
+
+
+def build_parser():
+    """Argument parser of the command line"""
+    parser = argparse.ArgumentParser(prog="quantifications", description="Pricing pack quantifications from Navisworks csv exports")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {VERSION}")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reporting = argparse.ArgumentParser(add_help=False)
+    reporting.add_argument("--timings", action="store_true", help="Report the start up and import time and the time of each stage")
+    reporting.add_argument("--profile", choices=["cProfile", "tracemalloc"], help="Also capture a profile, implies --timings")
+    reporting.add_argument("--run-log", help="Append the run summary to this JSON lines file")
+    reporting.add_argument("-q", "--quiet", action="store_true", help="Only report errors")
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--rules", help="csv / xlsx of name rules (Input, Output), defaults to the rules saved by the App")
+    common.add_argument("--pivot", choices=["static", "live", "none"], default="static",
+                        help="Pivot Table sheet: static, live or none (default: static)")
+    common.add_argument("--units", choices=["values", "formula"], default="values", help="Units column (default: values)")
+    common.add_argument("--sheet", choices=["table", "filter"], default="table",
+                        help="Quantifications sheet: an Excel table, or a plain autofilter which takes far less memory "
+                             "to write, about 150 bytes less per cell (default: table)")
+    common.add_argument("--cache", action="store_true", help="Reuse the quantified table of an unchanged export")
+
+    run = commands.add_parser("run", parents=[common, reporting], help="Quantify one csv export")
+    run.add_argument("input", help="Navisworks csv export, or a Quantifications workbook of an earlier run")
+    run.add_argument("-o", "--output", help="Workbook to write (default: next to the export)")
+    run.add_argument("--chunksize", type=int, help="Stream the export this many rows at a time to bound memory, the sheet gets an autofilter")
+    run.add_argument("--workers", type=int, help="Processes for parts of the export (default: one per core for exports over 64 MB)")
+    run.add_argument("--revision", action="store_true", help="Save a snapshot next to the workbook for the next revision")
+    run.add_argument("--previous", help="Snapshot of the previous revision's run, only changed rows are processed (implies --revision), "
+                                        "or the previous revision's workbook when the input is a workbook")
+    run.set_defaults(function=run_command)
+
+    batch = commands.add_parser("batch", parents=[common, reporting], help="Quantify a folder of csv exports")
+    batch.add_argument("input", help="Folder or glob pattern of csv exports, a pattern can match Quantifications workbooks")
+    batch.add_argument("-o", "--output", required=True, help="Folder the workbooks are written to")
+    batch.add_argument("--merge", action="store_true", help="Write one merged workbook")
+    batch.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    batch.set_defaults(function=batch_command)
+
+    check = commands.add_parser("check", parents=[reporting], help="Check an export has the required columns, without reading its rows")
+    check.add_argument("input", help="Navisworks csv export")
+    check.set_defaults(function=check_command)
+
+    return parser
+
+
+def main(argv=None):
+    """Runs the command line
+
+    Args:
+        argv (str[], optional): Arguments, defaults to `sys.argv[1:]`
+
+    Returns:
+        int: Exit code
+    """
+    args = build_parser().parse_args(argv)
+    if args.quiet:
+        fns.logging = False
+
+    recorded = args.timings or args.profile is not None or args.run_log is not None
+    run = ins.Run(f"{args.command} {args.input}", args.profile, args.run_log) if recorded else contextlib.nullcontext()
+    try:
+        with run:
+            if recorded:
+                run.add("startup", startup_seconds())
+            args.function(args)
+    except hd.MissingColumnsError as e:
+        print(e, file=sys.stderr)
+        return BAD_INPUT
+    except (OSError, ValueError) as e:
+        print(f"{args.command} failed: {e}", file=sys.stderr)
+        return FAILED
+    finally:
+        # The run logs its own one line summary, this is the full report
+        if args.timings or args.profile is not None:
+            print(run.describe(), *(run.profile or []), sep="\n", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())